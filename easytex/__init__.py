@@ -11,6 +11,7 @@ from .classes.PDFs import PDFs
 
 from .classes.base_classes.LatexPart import LatexPart
 from .classes.base_classes.Container import Container
+from .classes.base_classes.Lazy import Lazy
 
 from .modules.report_functions import (
     make_table,
@@ -18,6 +19,9 @@ from .modules.report_functions import (
     make_row_colors_dict,
 )
 
+from .modules.cache import PDFCache
+from .modules.engines import Engine, XeLaTeX, PDFLaTeX, LuaLaTeX, StubEngine
+
 # A bit of a hack
 from os import path
 
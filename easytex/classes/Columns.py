@@ -1,5 +1,9 @@
 from collections import UserList
-from .base_classes.Container import Container
+from .base_classes.Container import ChildList, Container
+
+_COLUMN_BREAK = "\n\n\\columnbreak\n\n"
+
+_END_COLUMNS = "\n\\end{multicols}"
 
 class Columns(Container, UserList):
     """ 
@@ -17,12 +21,10 @@ class Columns(Container, UserList):
             if arg <= 0:
                 raise ValueError('Number of columns must be >= 1.')
             else:
-                self.num_cols = arg
                 self.data = [None] * arg
                     
         elif isinstance(arg, list):
             self.data = arg
-            self.num_cols = len(arg)
                 
         else:
             raise TypeError("""
@@ -30,27 +32,44 @@ class Columns(Container, UserList):
             or a list of column contents.
             """)
 
-    def unpack(self, container):
+    @property
+    def data(self):
         """
-        Masks base class Container unpack method.
-        Recursively checks passed Container and unpacks tex.
+        The contents of each column. Changing the list, e.g. columns[0] = Text('...')
+        or columns.append(part), invalidates the cached render.
         """
-        
-        tex = "\n\\begin{multicols}{" + str(self.num_cols) + "}\n"
-        
-        i = 1
-        
-        for child in self.data:
-            if isinstance(child, Container) is True and isinstance(child, UserList) is False:
-                if i < self.num_cols:
-                    tex += child.unpack(child) + "\n\n\\columnbreak\n\n"
-                else:
-                    tex += child.unpack(child)
-            else:
-                if i < self.num_cols:
-                    tex += child.tex  + "\n\n\\columnbreak\n\n"
-                else:
-                    tex += child.tex
-            i += 1
-        
-        return tex + "\n\\end{multicols}"
\ No newline at end of file
+
+        return self._data
+
+    @data.setter
+    def data(self, data):
+
+        self._data = ChildList(self, data)
+
+        self.invalidate()
+
+    @property
+    def num_cols(self):
+        """The number of columns, one per item in Columns.data."""
+
+        return len(self.data)
+
+    def layout(self):
+        """
+        Masks base class Container layout method.
+        Lays out a multicols environment with one column per item in
+        Columns.data (see Container.layout).
+        """
+
+        items = ["\n\\begin{multicols}{" + str(self.num_cols) + "}\n"]
+
+        for i, child in enumerate(self.data, start=1):
+
+            items.append(child)
+
+            if i < self.num_cols:
+                items.append(_COLUMN_BREAK)
+
+        items.append(_END_COLUMNS)
+
+        return items
@@ -1,3 +1,13 @@
+import asyncio
+import hashlib
+import io
+import os
+import re
+import shutil
+import subprocess
+from collections import namedtuple
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+
 # Import classe namespaces for class type comparisons
 from .Environment import Environment
 from .Figure import Figure
@@ -10,8 +20,33 @@ from .Columns import Columns
 from .PDFs import PDFs
 
 from .base_classes.LatexPart import LatexPart
-from .base_classes.Container import Container
-from ..modules.utils import _latex_special_chars, clean_tex
+from .base_classes.Container import Container, iter_part_tex
+from .base_classes.Lazy import Lazy
+from ..modules.utils import _latex_special_chars, clean_tex, resolve_file, resolve_graphic
+from ..modules.aux_seed import EntryCollector, write_seed
+from ..modules.engines import get_engine, reproducible_env
+from ..modules.recovery import (
+    FALLBACK_ENGINE,
+    check_strategy,
+    raised_memory_env,
+    rechunk_tex,
+)
+from ..modules.tex_log import parse_capacity_exceeded
+from ..modules.source_map import SourceMap
+from ..modules.optimizer import optimize_chunks, remap_spans
+from ..modules.validation import ProblemFinder, find_problems
+from ..modules.formats import dump_format, static_preamble
+from ..modules.render import (
+    CompileResult,
+    compile_tex,
+    compile_tex_async,
+    export_executor,
+    make_build_dir,
+    move_into_place,
+    ram_build_root,
+    restore_aux_files,
+    save_aux_files,
+)
 
 class Document:
     """
@@ -32,6 +67,7 @@ class Document:
         table_of_contents=True,
         list_of_figures=True,
         list_of_tables=True,
+        optimize=False,
     ):
         """
         Args
@@ -50,6 +86,13 @@ class Document:
         list_of_tables: bools
             True: Include a list of tables.
             False: Do not include a list of tables.
+        optimize: bool
+            True: Leave redundant commands out of the generated tex
+            (see optimizer.optimize_chunks). The pass runs in Python at
+            roughly 0.15 s per MB of tex, some 25 times the cost of writing
+            it out: worth it when the engine run it shortens is the
+            bottleneck, not for tex that is only exported.
+            False: Write every part's tex as it is.
         
         """
 
@@ -102,49 +145,53 @@ class Document:
 
             raise TypeError("include_title not a boolean.")
 
+        if isinstance(optimize, bool):
+
+            self.optimize = optimize
+
+        else:
+
+            raise TypeError("optimize not a boolean.")
+
         self.tex = ""
 
-    def add_toc(self):
-        """Adds the table of contents to the document. Also adds a fixed hyperlink anchor."""
+        self.source_map = None
 
-        self.body += "\\addtocontents{toc}{\\protect\\hypertarget{toc}{}}"
+    def add_toc(self):
+        """Sets Document.toc, so the front matter has the table of contents and 'toc' anchor."""
 
-        self.body += "\\tableofcontents\n"
+        self.toc = True
 
     def add_list_figures(self):
-        """Adds the list of figures to the document. Also adds a fixed hyperlink anchor."""
+        """Sets Document.lof, so the front matter has the list of figures and 'lof' anchor."""
 
-        self.body += "\\addtocontents{lof}{\\protect\\hypertarget{lof}{}}"
-
-        self.body += "\\listoffigures\n"
+        self.lof = True
 
     def add_list_tables(self):
-        """Adds the list of tables to the document. Also adds a fixed hyperlink anchor."""
-
-        self.body += "\\addtocontents{lot}{\\protect\\hypertarget{lot}{}}"
+        """Sets Document.lot, so the front matter has the list of tables and 'lot' anchor."""
 
-        self.body += "\\listoftables\n"
+        self.lot = True
 
     def add(self, part):
-        """ Adds a LatexPart to list self.Parts """
+        """
+        Adds a LatexPart to list self.Parts
+
+        A callable returning a LatexPart is added as a Lazy part,
+        built only when the document's tex is generated. The part it
+        builds is checked like one added directly.
+        """
+        if isinstance(part, LatexPart) is False and callable(part) is True:
+            part = Lazy(part)
+
         if isinstance(part, LatexPart) is False:
             raise TypeError("Tried to add a non-LatexPart object to document.")
 
-        if isinstance(part, Preamble) is True:
-            raise TypeError(
-                "Tried to add a Preamble, preamble should be specified on document creation."
-            )
+        if isinstance(part, Lazy) is True:
+            part.checks.append(_check_top_level_part)
+
+        else:
+            _check_top_level_part(part)
 
-        if isinstance(part, Table) is True:
-            if part.table_type == "tabular":
-                raise TypeError(
-                    "Cannot add naked tabular table to document. Encapsulate in an environment such as sidetable, or remake as table or longtable."
-                )
-        
-        if isinstance(part, Section) is True:
-            if part.type != "section":
-                raise TypeError("Cannot append a subsection or a sub-subsection directly to a document; subsections should be contained within their parent section only.")
-                
         self.parts += [part]
 
     def add_clearpage(self):
@@ -268,6 +315,20 @@ class Document:
             """
             )
             
+        if isinstance(part, Lazy):
+
+            part_printed = True
+
+            name = getattr(part.factory, "__name__", type(part.factory).__name__)
+
+            print(spacer, i, "Lazy")
+            print(
+                f"""
+    {spacer}    |
+    {spacer}     `--| Factory: {name}
+            """
+            )
+
         if isinstance(part, Container):
 
             part_printed = True
@@ -327,124 +388,1361 @@ class Document:
                 self._doc_map(child, ii, space + 8)
                 ii += 1
                 
+    def iter_parts(self):
+        """
+        Yields every LatexPart in the document in document order,
+        including parts nested within Containers, Columns and PDFs.
+
+        Lazy parts are built and the built part is yielded in their place.
+        """
+
+        stack = list(reversed(self.parts))
+
+        while stack:
+
+            part = stack.pop()
+
+            if part is None:
+                continue
+
+            # Built for the caller and dropped once it moves on.
+            if isinstance(part, Lazy):
+                part = part.build()
+
+            yield part
+
+            if isinstance(part, (Columns, PDFs)):
+                children = [child for child in part.data if isinstance(child, LatexPart)]
+
+            elif isinstance(part, Container):
+                children = part.children
+
+            else:
+                children = []
+
+            stack.extend(reversed(children))
+
+    def referenced_files(self):
+        """
+        Returns the external files the document's tex loads:
+        Figure images, PDFs pages and \\input files.
+
+        Files that cannot be found are returned by the name used in the tex.
+        """
+
+        return self._survey(validate=False).files
+
+    def validate(self):
+        """
+        Checks the part tree before any latex runs (see validation.find_problems).
+
+        Raises:
+        ValueError
+            Listing every problem found.
+        """
+
+        _raise_problems(find_problems(self))
+
+    def _survey(self, validate=True):
+        """
+        Walks the document's tex and parts once, building each Lazy part once,
+        and gathers everything a render needs before exporting.
+
+        Args
+        ----
+        validate: bool
+            If False, the part tree is not checked and problems is empty.
+
+        Returns:
+        survey: _Survey
+            problems: list, the validation.find_problems() of the document.
+            files: list, as returned by Document.referenced_files().
+            entries: tuple, the aux_seed.collect_entries() of the document.
+            digest: str, as returned by Document._tex_digest().
+        """
+
+        finder = ProblemFinder(self) if validate is True else None
+
+        collector = EntryCollector()
+
+        files = []
+
+        digest = hashlib.sha256()
+
+        for item in self._iter_parts_tex(parts=True):
+
+            if isinstance(item, str):
+
+                digest.update(item.encode("utf-8"))
+
+                files.extend(_input_files(item))
+
+                continue
+
+            part, containers = item
+
+            if finder is not None:
+                finder.check(part, containers)
+
+            collector.add(part)
+
+            files.extend(_part_files(part))
+
+        return _Survey(
+            [] if finder is None else finder.problems(),
+            files,
+            (collector.labels, collector.entries),
+            digest.hexdigest(),
+        )
+
     def merge_parts(self):
         """
         Iterates through Document.parts and combines each part's .tex contents
         into Document.tex.
         
-        This is used by both ~.export_tex() and ~.print_tex().
+        This is used by ~.print_tex() and by callers wanting the tex as one string.
         
         Ensures that nested LatexParts are properly unpacked and merged.
+
+        Also sets Document.source_map, which maps lines of Document.tex back
+        to the parts that emitted them. The part tree itself is not modified,
+        so merging again gives the same tex.
+
+        Returns:
+        tex: str
+            The document's complete tex.
+        """
+        spans = []
+
+        tex = "".join(self.iter_tex(spans))
+
+        self.tex = tex
+
+        self.source_map = SourceMap(tex, spans)
+
+        return tex
+
+    def iter_tex(self, spans=None, prelude=""):
+        """
+        Generator yielding the document's tex in chunks, part by part,
+        walking nested Containers, Columns and PDFs as it goes.
+
+        Nothing is joined, so the complete tex never has to be held in memory,
+        and nothing is modified, so several walks may run at once.
+
+        With Document.optimize, the chunks pass through the peephole optimizer
+        and spans are moved to match its output once the walk is done.
+
+        Args
+        ----
+        spans: list
+            If given, the (start, end, part) character range of every part is
+            appended to it (see source_map.SourceMap).
+        prelude: str
+            Tex appended to the \\begin{document} line. Must not contain
+            a newline, so line numbers are unchanged.
         """
-        parts = self.parts
 
-        self.body = "\n\n\\begin{document}\n"
+        if self.optimize is False:
+            yield from self._iter_parts_tex(spans, prelude)
+
+            return
+
+        deletions = []
+
+        part_spans = None if spans is None else []
+
+        yield from optimize_chunks(self._iter_parts_tex(part_spans, prelude), deletions)
+
+        if spans is not None:
+            spans.extend(remap_spans(part_spans, deletions))
+
+    def _iter_parts_tex(self, spans=None, prelude="", parts=False):
+        """
+        Generator yielding the document's tex as the parts produce it (see ~.iter_tex()).
+        With parts, also yields (part, containers) tuples (see iter_part_tex).
+        """
+
+        body = self._begin_document(prelude)
+
+        yield self.preamble
+
+        yield body
+
+        offset = len(self.preamble) + len(body)
+
+        for part in self.parts:
+            offset = yield from iter_part_tex(part, spans, offset, parts=parts)
+
+        yield "\n\n\\end{document}\n"
+
+    def _begin_document(self, prelude=""):
+        """Returns the \\begin{document} line, with prelude, and the front matter."""
+
+        return "\n\n\\begin{document}" + prelude + "\n" + self._front_matter()
+
+    def _front_matter(self):
+        """Returns the title, cover page and contents lists following \\begin{document}."""
+
+        tex = ""
         
         if self.include_title is True:
             if self.title is not None:
-                self.body += "\n\\maketitle\n\n"
+                tex += "\n\\maketitle\n\n"
         
         if self.cover_page is True:
-            self.body += '\\clearpage\n'
+            tex += '\\clearpage\n'
             
         if self.toc is True:
-            self.add_toc()
+            tex += "\\addtocontents{toc}{\\protect\\hypertarget{toc}{}}"
 
-        if self.lof is True:
-            self.add_list_figures()
+            tex += "\\tableofcontents\n"
 
-        if self.lot is True:
-            self.add_list_tables()
+        if self.lof is True:
+            tex += "\\addtocontents{lof}{\\protect\\hypertarget{lof}{}}"
 
-        for part in parts:
+            tex += "\\listoffigures\n"
 
-            if isinstance(part, Container):
-                self.body += part.unpack(part)
-            else:
-                self.body += part.tex
+        if self.lot is True:
+            tex += "\\addtocontents{lot}{\\protect\\hypertarget{lot}{}}"
 
-        self.body += "\n\n\\end{document}\n"
+            tex += "\\listoftables\n"
 
-        self.tex = self.preamble + self.body
+        return tex
 
     def print_tex(self):
 
-        self.merge_parts()
-
-        print(self.tex)
-
-        self.tex = ""
+        print("".join(self.iter_tex()))
 
-    def export_tex(self, file="output.tex"):
+    def export_tex(self, file="output.tex", prelude=""):
         """
         Adds an end document command if end_doc is False, and sets the end_doc flag to True.
         Combines document's preamble and body and then saves to 'output.tex' in the local directory.
+
+        The tex is written chunk by chunk as Document.iter_tex produces it, so
+        Document.tex is not built (use ~.merge_parts() for that).
+        Document.source_map is set for the written file.
+
+        Several exports of one Document may run at once, e.g. from threads;
+        each gets its own SourceMap back, while Document.source_map holds the
+        last one finished.
+
+        Args
+        ----
+        file: str
+            Path of the tex file to write.
+        prelude: str
+            Tex appended to the \\begin{document} line (see ~.iter_tex()).
+
+        Returns:
+        source_map: SourceMap
+            Maps lines of file back to the parts that emitted them.
         """
 
-        self.merge_parts()
+        spans = []
+
+        line_starts = [0]
+
+        offset = 0
 
         with open(f"{file}", "w+") as output:
 
-            output.write(self.tex)
+            for chunk in self.iter_tex(spans, prelude):
+
+                output.write(chunk)
 
-            output.close()
+                line_starts += [offset + match.end() for match in re.finditer("\n", chunk)]
+
+                offset += len(chunk)
+
+        source_map = SourceMap(spans=spans, line_starts=line_starts)
+
+        self.source_map = source_map
 
         self.tex_path = file
 
-    def render_report(self, destination):
+        return source_map
+
+    def _tex_digest(self):
+        """
+        Returns the sha256 hex digest of the document's tex, computed chunk by
+        chunk, before Document.optimize is applied.
+        """
+
+        digest = hashlib.sha256()
+
+        for chunk in self._iter_parts_tex():
+            digest.update(chunk.encode("utf-8"))
+
+        return digest.hexdigest()
+
+    def export_split(self, file="output.tex", prelude=""):
+        """
+        Exports the document with every top-level Section in its own file,
+        named by a hash of its content and pulled in with \\input.
+
+        Only files whose content changed are written: an unchanged Section
+        keeps its file, and the main file is left alone if it is identical.
+        Section files from earlier exports that are no longer used are removed.
+        File modification times therefore show exactly what changed.
+
+        Document.source_map is set for the main file; lines of the section
+        files are not mapped, an \\input line maps to its Section.
+
+        Args
+        ----
+        file: str
+            Path of the main tex file. Section files are written next to it.
+        prelude: str
+            Tex appended to the \\begin{document} line (see ~.iter_tex()).
+
+        Returns:
+        written: list
+            Paths of the files that were written.
+        """
+
+        directory = os.path.dirname(os.path.abspath(file))
+
+        jobname = os.path.splitext(os.path.basename(file))[0]
+
+        written = []
+
+        used = set()
+
+        spans = []
+
+        chunks = [self.preamble, self._begin_document(prelude)]
+
+        offset = len(chunks[0]) + len(chunks[1])
+
+        for part in self.parts:
+
+            if isinstance(part, Section) is False:
+
+                for chunk in iter_part_tex(part, spans, offset):
+
+                    chunks.append(chunk)
+
+                    offset += len(chunk)
+
+                continue
+
+            tex = self._join_tex(iter_part_tex(part))
+
+            name = jobname + "-" + hashlib.sha256(tex.encode("utf-8")).hexdigest()[:16]
+
+            used.add(name + ".tex")
+
+            path = os.path.join(directory, name + ".tex")
+
+            # Named by its content: an existing file is already up to date.
+            if os.path.exists(path) is False:
+
+                with open(path, "w") as output:
+                    output.write(tex)
+
+                written.append(path)
+
+            command = "\\input{" + name + "}"
+
+            chunks.append(command)
+
+            spans.append((offset, offset + len(command), part))
+
+            offset += len(command)
+
+        chunks.append("\n\n\\end{document}\n")
+
+        deletions = []
+
+        tex = self._join_tex(chunks, deletions)
+
+        spans = remap_spans(spans, deletions)
+
+        previous = None
+
+        if os.path.exists(file):
+            with open(file, "r") as existing:
+                previous = existing.read()
+
+        if tex != previous:
+
+            with open(file, "w") as output:
+                output.write(tex)
+
+            written.append(file)
+
+        stale = re.compile(re.escape(jobname) + r"-[0-9a-f]{16}\.tex$")
+
+        for name in os.listdir(directory):
+            if stale.match(name) and name not in used:
+                os.remove(os.path.join(directory, name))
+
+        self.source_map = SourceMap(tex, spans)
+
+        self.tex_path = file
+
+        return written
+
+    def _join_tex(self, chunks, deletions=None):
+        """
+        Joins tex chunks, through the peephole optimizer if Document.optimize
+        is True (see optimizer.optimize_chunks for deletions).
+        """
+
+        if self.optimize is True:
+            chunks = optimize_chunks(chunks, deletions)
+
+        return "".join(chunks)
+
+    def export_preview(self, file, sections):
+        """
+        Exports the document with every top-level Section in its own file,
+        pulled in with \\include, and an \\includeonly list so latex only
+        typesets the selected sections.
+
+        Sections left out keep the numbers and pages recorded in their .aux
+        files, which must sit next to file. Sections without an .aux file are
+        always typeset.
+
+        Args
+        ----
+        file: str
+            Path of the main tex file. Section files are written next to it.
+        sections: list
+            The Section parts to typeset, given as Section objects or titles.
+        """
+
+        directory = os.path.dirname(os.path.abspath(file))
+
+        jobname = os.path.splitext(os.path.basename(file))[0]
+
+        selected = self._preview_sections(sections)
+
+        included = []
+
+        number = 0
+
+        body = self._begin_document()
+
+        for part in self.parts:
+
+            if isinstance(part, Section):
+
+                number += 1
+
+                name = jobname + "-section-" + str(number)
+
+                body += "\\include{" + name + "}\n"
+
+                aux_file = os.path.join(directory, name + ".aux")
+
+                if id(part) in selected or os.path.exists(aux_file) is False:
+
+                    included.append(name)
+
+                    with open(os.path.join(directory, name + ".tex"), "w") as output:
+                        output.write(self._join_tex(iter_part_tex(part)))
+
+            else:
+                body += "".join(iter_part_tex(part))
+
+        body += "\n\n\\end{document}\n"
+
+        # Lines of the section files are not mapped.
+        self.source_map = None
+
+        with open(file, "w") as output:
+            output.write(
+                self._join_tex([self.preamble, "\\includeonly{" + ",".join(included) + "}\n", body])
+            )
+
+        self.tex_path = file
+
+    def _preview_sections(self, sections):
+        """Returns the ids of the top-level Sections named by sections."""
+
+        top_level = [part for part in self.parts if isinstance(part, Section)]
+
+        selected = set()
+
+        for section in sections:
+
+            matches = [
+                part
+                for part in top_level
+                if part is section or (isinstance(section, str) and part.name == section)
+            ]
+
+            if len(matches) == 0:
+                raise ValueError(f"{section!r} is not a top-level section of the document.")
+
+            selected.update(id(part) for part in matches)
+
+        return selected
+
+    @contextmanager
+    def _build_dir(self, build_root=None, aux_state=None, prelude="", sections=None):
+        """
+        Exports the document into a fresh build directory, yields the tex file
+        path and its SourceMap, and removes the build directory afterwards.
+
+        Args
+        ----
+        build_root: str
+            Directory in which the build directory is created.
+            If None, the system temporary directory is used.
+        aux_state: str
+            Optional directory of auxiliary files kept from the previous render.
+            They are copied in before latex runs and saved back after a
+            successful build.
+        prelude: str
+            Tex appended to the \\begin{document} line of the exported file,
+            such as an engine's reproducible_tex() (see Document.export_tex).
+        sections: list
+            If given, the document is exported for a preview of these
+            sections (see Document.export_preview).
+        """
+
+        build_dir = make_build_dir(build_root)
+
+        try:
+            tex_file = os.path.join(build_dir, "output.tex")
+
+            # Restored first: a preview needs the sections' .aux files.
+            if aux_state is not None:
+                restore_aux_files(aux_state, build_dir, "output")
+
+            source_map = None
+
+            if sections is not None:
+                self.export_preview(tex_file, sections)
+
+            else:
+                source_map = self.export_tex(tex_file, prelude)
+
+            yield tex_file, source_map
+
+            if aux_state is not None:
+                save_aux_files(build_dir, aux_state, "output")
+
+        finally:
+            # Clean up temporary files
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    def seed_aux(self, directory, jobname="output", entries=None):
+        """
+        Writes auxiliary files numbering this document's sections, tables and
+        figures into directory, so the first latex pass typesets them.
+
+        Page numbers come from auxiliary files already in directory
+        (e.g. restored from aux_dir); unknown pages still need a second pass.
+
+        Args
+        ----
+        entries: tuple
+            The document's aux_seed.collect_entries(), if already collected.
+
+        Returns:
+        state: tuple
+            The seeded state, to pass to compile_tex as seed_state.
+        """
+
+        return write_seed(self, directory, jobname, entries)
+
+    def _recovery(self, strategy, error, tex_file, source_map, engine, env, deterministic):
         """
-        Renders a pdf file from a specified tex file (tex_file),
-        and moves the rendered pdf to 'destination'.
+        Prepares a retry of a compile that failed with "TeX capacity exceeded".
 
         Args
         ----
+        strategy: str
+            One of recovery.STRATEGIES, or None for no recovery.
+        error: subprocess.CalledProcessError
+            The failed compile's error; its output holds the engine's log tail.
         tex_file: str
-            A string representing the tex file to be processed.
-        destination: str
-            A string representing the pdf files final name.
+            The exported tex file, rewritten by the "rechunk" strategy.
+        source_map: SourceMap
+            The map of tex_file, locating the part that ran out of memory.
+        engine: Engine
+            The engine that failed.
+        env: dict
+            The engine's environment, or None.
+        deterministic: bool
+            Whether tex_file carries the engine's reproducible_tex().
+
+        Returns:
+        retry: tuple
+            The (engine, env) to retry with, or None if the error is not
+            recoverable with strategy.
         """
 
-        import subprocess
-        import shutil
-        import os
-        
-        self.export_tex("output.tex")
-        
-        # Tex should be ran three times to ensure TOC and references are propery generated.
+        capacity = parse_capacity_exceeded(error.output or "")
+
+        if strategy is None or capacity is None:
+            return None
+
+        if strategy == "memory":
+            return engine, raised_memory_env(env)
+
+        if strategy == "engine":
+
+            retry_engine = get_engine(FALLBACK_ENGINE)
+
+            if deterministic is True:
+                self.export_tex(tex_file, retry_engine.reproducible_tex(self._tex_digest()))
+
+            return retry_engine, env
+
+        part = None
+
+        if source_map is not None:
+            part = source_map.part_at(capacity[1])
+
+        lines = None
+
+        if isinstance(part, Table) and part.table_type == "longtable":
+            lines = source_map.lines_of(part)
+
+        with open(tex_file, "r") as file:
+            tex = file.read()
+
+        with open(tex_file, "w") as output:
+            output.write(rechunk_tex(tex, lines))
+
+        return engine, env
+
+    def _format_file(self, engine, format_cache, timeout=None):
+        """
+        Returns the precompiled format for this document's preamble, or None.
+
+        Args
+        ----
+        engine: Engine
+            The engine the format is built for.
+        format_cache: str
+            Directory for precompiled formats. If None, no format is used.
+        timeout: float
+            Seconds the format dump may take.
+        """
+
+        if format_cache is None or engine.supports_formats is False:
+            return None
+
+        static_tex = static_preamble(self.preamble)
+
+        if static_tex is None:
+            return None
+
+        return dump_format(static_tex, engine.executable, format_cache, timeout=timeout)
+
+    def _aux_state(self, aux_dir, aux_name=None, survey=None):
+        """
+        Returns the directory holding this document's persistent auxiliary
+        files, or None if aux_dir is None.
+
+        Args
+        ----
+        aux_dir: str
+            Root directory for persistent auxiliary files.
+        aux_name: str
+            Identity of the document. Renders sharing a name share auxiliary
+            files. Defaults to a hash of the preamble (title, author, date),
+            the section titles and the table and figure labels, so reports
+            sharing a preamble but not an outline do not share files.
+        survey: _Survey
+            The document's Document._survey, if already taken.
+        """
+
+        if aux_dir is None:
+            return None
+
+        if aux_name is None:
+
+            if survey is None:
+                survey = self._survey(validate=False)
+
+            aux_name = _outline_digest(self.preamble, survey.entries)
+
+        return os.path.join(aux_dir, aux_name)
+
+    def _cache_key(self, cache, engine, survey, deterministic=False):
+        """
+        Returns the PDFCache key for the document, or None without a cache.
+        The tex is keyed through survey's digest (see Document._survey).
+        """
+
+        if cache is None:
+            return None
+
+        salt = engine.name
+
+        if deterministic is True:
+            salt += "-deterministic"
+
+        # The digest is taken before optimizing, which the output depends on.
+        if self.optimize is True:
+            salt += "-optimized"
+
+        return cache.key(survey.digest, survey.files, salt=salt)
+
+    def _publish_pdf(self, tex_file, destination, cache=None, key=None):
+        """
+        Moves the pdf rendered from tex_file to destination (a path or
+        binary stream), storing a copy in cache first if one is given.
+        """
+
+        pdf_file = os.path.splitext(tex_file)[0] + ".pdf"
+
+        if cache is not None:
+            cache.put(key, pdf_file)
+
+        move_into_place(pdf_file, destination)
+
+    def _publish_cached(self, cache, key, destination):
+        """
+        Copies a cached pdf to destination (a path or binary stream).
+        Returns False on a cache miss.
+        """
+
+        if cache is None:
+            return False
+
+        cached = cache.get(key)
+
+        if cached is None:
+            return False
+
+        move_into_place(cached, destination)
+
+        return True
+
+    def render_report(
+        self,
+        destination,
+        engine="xelatex",
+        max_passes=5,
+        build_root=None,
+        timeout=None,
+        total_timeout=None,
+        cpu_limit=None,
+        memory_limit=None,
+        format_cache=None,
+        cache=None,
+        aux_dir=None,
+        aux_name=None,
+        seed_aux=False,
+        in_memory=False,
+        deterministic=False,
+        validate=True,
+        recover=None,
+    ):
+        """
+        Renders the document to a pdf file at 'destination'.
+
+        Every render gets its own build directory, so several renders may run
+        at once in the same process or working directory. Latex is re-run only
+        until cross-references, the table of contents and lists of figures/tables
+        have converged (see render.compile_tex).
+
+        Args
+        ----
+        destination: str or file object
+            A string representing the pdf files final name, or a writable
+            binary stream (e.g. io.BytesIO) the pdf is written to.
+        engine: str or Engine
+            'xelatex' (default), 'pdflatex', 'lualatex', 'stub' or an engines.Engine.
+            The stub engine writes a placeholder pdf without running TeX.
+        max_passes: int
+            Upper limit on the number of latex passes.
+        build_root: str
+            Directory in which the per-render build directory is created.
+            If None, the system temporary directory is used.
+        timeout: float
+            Seconds a single latex pass may take before it is killed.
+        total_timeout: float
+            Seconds the whole compile may take before it is killed.
+        cpu_limit: int
+            Optional cpu time limit per latex pass, in seconds.
+        memory_limit: int
+            Optional memory limit per latex pass, in bytes.
+        format_cache: str
+            Directory for precompiled preamble formats. If set, the static part
+            of the preamble is dumped once to a format and later compiles start
+            from it. Preambles without formats.DUMP_MARKER are compiled as usual.
+        cache: PDFCache
+            Optional cache of rendered pdfs. If the document and every file it
+            references are unchanged since a cached render, latex is not run.
+        aux_dir: str
+            Directory for persistent auxiliary files (.aux, .toc, .lof, .lot, .out).
+            If set, each render starts from the previous render's auxiliary
+            files, so a re-render with unchanged structure converges in one pass.
+        aux_name: str
+            Identity of the document under aux_dir. Defaults to a hash of
+            the preamble, section titles and labels.
+        seed_aux: bool
+            If True, section, table and figure numbers are written to the
+            auxiliary files before the first pass (see Document.seed_aux), so
+            a document whose pages are already known needs a single pass.
+        in_memory: bool
+            If True, the build directory is created on a tmpfs
+            (render.RAM_BUILD_ROOT) so the exported tex, auxiliary files and
+            intermediate output never touch the disk. Falls back to build_root
+            when the tmpfs is missing or has less than render.RAM_MIN_FREE free.
+        deterministic: bool
+            If True, identical documents render to byte-identical pdfs: dates
+            are pinned with SOURCE_DATE_EPOCH (see engines.reproducible_env)
+            and the pdf trailer id is derived from the document.
+        validate: bool
+            If True, the part tree is checked with Document.validate before
+            latex runs, and a ValueError lists every problem found.
+        recover: str
+            How to retry, once, a compile that fails with "TeX capacity exceeded":
+            'memory' raises TeX's memory settings (recovery.RAISED_MEMORY),
+            'engine' switches to lualatex, which allocates memory dynamically,
+            'rechunk' lowers longtable's chunk size for the offending table
+            (or the whole document if the error is not inside a longtable).
+            The strategy is recorded in result.recovery. None (default) never retries.
+
+        Returns:
+        result: render.CompileResult
+            Per-pass timings, the parsed latex log and the page count.
+            result.error_parts and result.box_parts map log lines back to parts.
+            On a cache hit result.cached is True and no passes are listed.
+        """
+
+        engine, build_root, key, env, survey, aux_state = self._render_setup(
+            engine,
+            recover,
+            validate,
+            in_memory,
+            build_root,
+            cache,
+            deterministic,
+            seed_aux,
+            aux_dir,
+            aux_name,
+        )
+
+        with nullcontext() if cache is None else cache.lock(key):
+
+            steps = self._render_steps(
+                destination,
+                engine,
+                env,
+                cache,
+                key,
+                survey,
+                build_root,
+                format_cache,
+                aux_state,
+                seed_aux,
+                deterministic,
+                recover,
+                dict(
+                    max_passes=max_passes,
+                    timeout=timeout,
+                    total_timeout=total_timeout,
+                    cpu_limit=cpu_limit,
+                    memory_limit=memory_limit,
+                ),
+            )
+
+            return _run_steps(steps)
+
+    def _render_setup(
+        self,
+        engine,
+        recover,
+        validate,
+        in_memory,
+        build_root,
+        cache,
+        deterministic,
+        seed_aux,
+        aux_dir,
+        aux_name,
+    ):
+        """
+        Checks render_report's arguments and, if validate is True, the part tree.
+
+        Validation, the cache key, the deterministic digest, the aux seed and
+        the default aux_name all come from a single Document._survey, so each
+        Lazy part is built once here and once more by the export.
+
+        Returns:
+        engine, build_root, key, env, survey, aux_state:
+        Engine, str, str, dict, _Survey, str
+            The engine, the build root to use, the PDFCache key (None without
+            a cache), the engine's environment (None unless deterministic),
+            the survey (None if nothing needed it) and the directory of the
+            document's persistent auxiliary files (None without aux_dir).
+        """
+
+        engine = get_engine(engine)
+
+        check_strategy(recover)
+
+        survey = None
+
+        if (
+            validate is True
+            or cache is not None
+            or deterministic is True
+            or seed_aux is True
+            or (aux_dir is not None and aux_name is None)
+        ):
+            survey = self._survey(validate)
+
+        if validate is True:
+            _raise_problems(survey.problems)
+
+        if in_memory is True:
+            build_root = ram_build_root(build_root)
+
+        key = self._cache_key(cache, engine, survey, deterministic)
+
+        env = reproducible_env() if deterministic is True else None
+
+        aux_state = self._aux_state(aux_dir, aux_name, survey)
+
+        return engine, build_root, key, env, survey, aux_state
+
+    def _render_steps(
+        self,
+        destination,
+        engine,
+        env,
+        cache,
+        key,
+        survey,
+        build_root,
+        format_cache,
+        aux_state,
+        seed_aux,
+        deterministic,
+        recover,
+        options,
+    ):
+        """
+        Generator doing render_report's work inside the cache lock, except
+        running latex, so render_report and render_report_async share it.
+
+        Yields a (tex_file, engine, format_file, env, options) request per
+        compile, and is sent the compile's CompileResult or thrown its
+        subprocess.CalledProcessError. Returns the render's CompileResult.
+        """
+
+        if self._publish_cached(cache, key, destination):
+            return CompileResult(cached=True)
+
+        timeout = options["timeout"]
+
+        format_file = self._format_file(engine, format_cache, timeout)
+
+        prelude = ""
+
+        if deterministic is True:
+            prelude = engine.reproducible_tex(survey.digest)
+
+        with self._build_dir(build_root, aux_state, prelude) as (tex_file, source_map):
+
+            options = dict(options, output_directory=os.path.dirname(tex_file))
 
-        tex_file = self.tex_path
+            if seed_aux is True:
+                options["seed_state"] = self.seed_aux(
+                    os.path.dirname(tex_file), entries=survey.entries
+                )
+
+            try:
+                result = yield tex_file, engine, format_file, env, options
+
+            except subprocess.CalledProcessError as error:
+
+                retry = self._recovery(
+                    recover, error, tex_file, source_map, engine, env, deterministic
+                )
+
+                if retry is None:
+                    raise
+
+                retry_engine, retry_env = retry
+
+                retry_format = self._format_file(retry_engine, format_cache, timeout)
+
+                result = yield tex_file, retry_engine, retry_format, retry_env, options
+
+                result.recovery = recover
+
+            self._publish_pdf(tex_file, destination, cache, key)
+
+            result.source_map = source_map
+
+        return result
+
+    async def render_report_async(
+        self,
+        destination,
+        engine="xelatex",
+        max_passes=5,
+        build_root=None,
+        timeout=None,
+        total_timeout=None,
+        cpu_limit=None,
+        memory_limit=None,
+        format_cache=None,
+        cache=None,
+        aux_dir=None,
+        aux_name=None,
+        seed_aux=False,
+        in_memory=False,
+        deterministic=False,
+        validate=True,
+        recover=None,
+        semaphore=None,
+    ):
+        """
+        Awaitable version of render_report.
+
+        Latex runs without blocking the event loop, and validation, export and
+        publishing run on render.export_executor(), so a large report does not
+        hold up other tasks either.
+
+        Takes the same arguments as render_report, plus:
+
+        semaphore: asyncio.Semaphore
+            Caps how many latex processes run at once across renders.
+            If None, the event loop's shared render.engine_semaphore() is used.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        engine, build_root, key, env, survey, aux_state = await loop.run_in_executor(
+            export_executor(),
+            self._render_setup,
+            engine,
+            recover,
+            validate,
+            in_memory,
+            build_root,
+            cache,
+            deterministic,
+            seed_aux,
+            aux_dir,
+            aux_name,
+        )
+
+        async with _no_lock() if cache is None else cache.lock_async(key):
+
+            steps = self._render_steps(
+                destination,
+                engine,
+                env,
+                cache,
+                key,
+                survey,
+                build_root,
+                format_cache,
+                aux_state,
+                seed_aux,
+                deterministic,
+                recover,
+                dict(
+                    max_passes=max_passes,
+                    timeout=timeout,
+                    total_timeout=total_timeout,
+                    cpu_limit=cpu_limit,
+                    memory_limit=memory_limit,
+                ),
+            )
+
+            return await _run_steps_async(steps, semaphore)
+
+    def render_preview(
+        self,
+        destination,
+        sections,
+        aux_dir,
+        aux_name=None,
+        engine="xelatex",
+        max_passes=5,
+        build_root=None,
+        timeout=None,
+        total_timeout=None,
+        validate=True,
+    ):
+        """
+        Renders a pdf containing only the selected top-level sections.
+
+        Each section is exported to its own file and pulled in with \\include,
+        so sections left out keep the numbering, references and pages from
+        the .aux files of previous previews, kept under aux_dir. The first
+        preview of a document typesets every section to record them.
+
+        \\include starts every section on a new page, so page numbers can
+        differ from render_report's.
+
+        Args
+        ----
+        destination: str or file object
+            A string representing the pdf files final name, or a writable
+            binary stream the pdf is written to.
+        sections: list
+            The Section parts to typeset, given as Section objects or titles.
+        aux_dir: str
+            Directory for persistent auxiliary files (see render_report).
+        aux_name: str
+            Identity of the document under aux_dir. Defaults to a hash of
+            the preamble, section titles and labels.
+        engine: str or Engine
+            'xelatex' (default), 'pdflatex', 'lualatex', 'stub' or an engines.Engine.
+        max_passes: int
+            Upper limit on the number of latex passes.
+        build_root: str
+            Directory in which the per-render build directory is created.
+            If None, the system temporary directory is used.
+        timeout: float
+            Seconds a single latex pass may take before it is killed.
+        total_timeout: float
+            Seconds the whole compile may take before it is killed.
+        validate: bool
+            If True, the part tree is checked with Document.validate first.
+
+        Returns:
+        result: render.CompileResult
+            Per-pass timings, the parsed latex log and the page count.
+        """
+
+        engine = get_engine(engine)
+
+        survey = None
+
+        if validate is True or aux_name is None:
+            survey = self._survey(validate)
+
+        if validate is True:
+            _raise_problems(survey.problems)
+
+        # Kept apart from render_report's files, which have no per-section .aux.
+        aux_state = os.path.join(self._aux_state(aux_dir, aux_name, survey), "preview")
+
+        with self._build_dir(build_root, aux_state, sections=sections) as (tex_file, _):
+
+            build_dir = os.path.dirname(tex_file)
+
+            # Latex looks for the \\include'd section files in the build directory.
+            env = dict(os.environ)
+
+            env["TEXINPUTS"] = build_dir + os.pathsep + env.get("TEXINPUTS", "")
+
+            result = compile_tex(
+                tex_file,
+                engine=engine,
+                output_directory=build_dir,
+                max_passes=max_passes,
+                timeout=timeout,
+                total_timeout=total_timeout,
+                env=env,
+            )
+
+            self._publish_pdf(tex_file, destination)
+
+        return result
+
+    def render_bytes(self, **kwargs):
+        """
+        Renders the document and returns the pdf as bytes.
+
+        No file is written outside the build directory, which is removed
+        afterwards. Takes the same keyword arguments as render_report.
+        """
+
+        buffer = io.BytesIO()
+
+        self.render_report(buffer, **kwargs)
+
+        return buffer.getvalue()
+
+    async def render_bytes_async(self, **kwargs):
+        """
+        Awaitable version of render_bytes.
+        Takes the same keyword arguments as render_report_async.
+        """
+
+        buffer = io.BytesIO()
 
-        for i in range(0, 3, 1):
+        await self.render_report_async(buffer, **kwargs)
+
+        return buffer.getvalue()
+
+
+# What Document._survey gathers in its single walk.
+_Survey = namedtuple("_Survey", ["problems", "files", "entries", "digest"])
+
+_INPUT_PATTERN = re.compile(r"\\input\{([^}]*)\}")
+
+
+def _part_files(part):
+    """Returns the files a Figure or PDFs part loads (see Document.referenced_files)."""
+
+    if isinstance(part, Figure) and part.filename != "":
+        return [resolve_graphic(part.filename, part.graphics_path) or part.filename]
+
+    if isinstance(part, PDFs):
+        return [resolve_file(str(name), extensions=["", ".pdf"]) or name for name in part.data]
+
+    return []
+
+
+def _input_files(tex):
+    """Returns the files tex loads with \\input (see Document.referenced_files)."""
+
+    return [
+        resolve_file(name, extensions=["", ".tex"]) or name
+        for name in _INPUT_PATTERN.findall(tex)
+    ]
+
+
+def _raise_problems(problems):
+    """Raises a ValueError listing problems, if there are any (see Document.validate)."""
+
+    if len(problems) > 0:
+        raise ValueError(
+            "Document failed validation:\n" + "\n".join("  " + problem for problem in problems)
+        )
+
+
+def _outline_digest(preamble, entries):
+    """
+    Returns a hash of a document's preamble, section titles and labels, given
+    its aux_seed entries (see Document._aux_state).
+    """
+
+    labels, entries = entries
+
+    outline = [preamble]
+
+    outline.extend(
+        kind + ":" + title for list_name, kind, _, title, _ in entries if list_name == "toc"
+    )
+
+    outline.extend("label:" + name for name, _, _, _ in labels)
+
+    return hashlib.sha1("\n".join(outline).encode("utf-8")).hexdigest()
+
+
+def _check_top_level_part(part):
+    """Raises a TypeError if part cannot be added directly to a Document."""
+
+    if isinstance(part, Preamble) is True:
+        raise TypeError(
+            "Tried to add a Preamble, preamble should be specified on document creation."
+        )
+
+    if isinstance(part, Table) is True:
+        if part.table_type == "tabular":
+            raise TypeError(
+                "Cannot add naked tabular table to document. Encapsulate in an environment such as sidetable, or remake as table or longtable."
+            )
+
+    if isinstance(part, Section) is True:
+        if part.type != "section":
+            raise TypeError("Cannot append a subsection or a sub-subsection directly to a document; subsections should be contained within their parent section only.")
+
+
+@asynccontextmanager
+async def _no_lock():
+    """An async context manager that does nothing."""
+
+    yield
+
+
+def _advance(steps, value=None, error=None):
+    """
+    Resumes a Document._render_steps generator with a compile's result or error.
+
+    Returns:
+    done, value: bool, object
+        False and the next compile request, or True and the render's result.
+    """
+
+    try:
+        if error is not None:
+            return False, steps.throw(error)
+
+        return False, steps.send(value)
+
+    except StopIteration as stop:
+        return True, stop.value
+
+
+def _run_steps(steps):
+    """Runs a Document._render_steps generator, compiling with compile_tex."""
+
+    try:
+        done, value = _advance(steps)
+
+        while done is False:
+
+            tex_file, engine, format_file, env, options = value
 
             try:
-                subprocess.call(["xelatex", tex_file])
+                result = compile_tex(
+                    tex_file, engine=engine, format_file=format_file, env=env, **options
+                )
+
+            except subprocess.CalledProcessError as error:
+                done, value = _advance(steps, error=error)
+
+            else:
+                done, value = _advance(steps, result)
 
-            except Exception:
+        return value
 
-                raise
+    finally:
+        # Removes the build directory of a render that failed in any other
+        # way, e.g. a timeout or KeyboardInterrupt, as _run_steps_async does.
+        steps.close()
 
-        # Move rendered pdf
-        start = tex_file.rfind("/") + 1
 
-        end = tex_file.rfind(".")
+async def _run_steps_async(steps, semaphore=None):
+    """
+    Runs a Document._render_steps generator on render.export_executor(),
+    compiling with compile_tex_async.
+    """
 
-        tex_file = tex_file[start:end] + ".pdf"
+    executor = export_executor()
 
-        shutil.move(tex_file, f"{destination}")
+    step = executor.submit(_advance, steps)
 
-        # Clean up temporary files
-        os.remove("output.aux")
+    try:
+        done, value = await asyncio.wrap_future(step)
 
-        os.remove("output.log")
+        while done is False:
 
-        os.remove("output.out")
+            tex_file, engine, format_file, env, options = value
 
-        os.remove("output.tex")
+            try:
+                result = await compile_tex_async(
+                    tex_file,
+                    engine=engine,
+                    format_file=format_file,
+                    env=env,
+                    semaphore=semaphore,
+                    **options,
+                )
 
-        try:
+            except subprocess.CalledProcessError as error:
+                step = executor.submit(_advance, steps, None, error)
+
+            else:
+                step = executor.submit(_advance, steps, result)
 
-            os.remove("output.toc")
+            done, value = await asyncio.wrap_future(step)
 
-        except:
+        return value
 
-            pass
+    finally:
+        # Removes the build directory of a cancelled or failed render, once
+        # the step still running in its thread, if any, has returned.
+        step.add_done_callback(lambda _: executor.submit(steps.close))
@@ -1,5 +1,5 @@
 from collections import UserList
-from .base_classes.Container import Container
+from .base_classes.Container import ChildList, Container
 
 class PDFs(Container, UserList):
     """ 
@@ -59,36 +59,86 @@ class PDFs(Container, UserList):
             or a list of column contents.
             """)
 
-    def unpack(self, container):
+    @property
+    def data(self):
         """
-        Masks base class Container unpack method.
-        Recursively checks passed Container and unpacks tex.
+        The pdf file names. Changing the list, e.g. pdfs[0] = 'appendix.pdf'
+        or pdfs.append('notes.pdf'), invalidates the cached render.
+        """
+
+        return self._data
+
+    @data.setter
+    def data(self, data):
+
+        self._data = ChildList(self, data)
+
+        self.invalidate()
+
+    @property
+    def rotation(self):
+        """
+        The rotation of each pdf in degrees, or None for no rotation.
+        Changing the list, or assigning a new one, invalidates the cached render.
+        """
+
+        return self._rotation
+
+    @rotation.setter
+    def rotation(self, rotation):
+
+        self._rotation = None if rotation is None else ChildList(self, rotation)
+
+        self.invalidate()
+
+    @property
+    def scale(self):
+        """
+        The scale of each pdf, between 0 and 1, or None for full size.
+        Changing the list, or assigning a new one, invalidates the cached render.
+        """
+
+        return self._scale
+
+    @scale.setter
+    def scale(self, scale):
+
+        self._scale = None if scale is None else ChildList(self, scale)
+
+        self.invalidate()
+
+    def layout(self):
+        """
+        Masks base class Container layout method.
+        Lays out an \\includepdf command per file in PDFs.data
+        (see Container.layout).
         """
         
         tex = ""
         
-        i = 1
+        rotations = self.rotation
+        
+        scales = self.scale
         
-        if self.rotation is None:
-            self.rotation = [0] * len(self.data)
+        if rotations is None:
+            rotations = [0] * len(self.data)
             
-        elif len(self.rotation) != len(self.data):
+        elif len(rotations) != len(self.data):
             raise ValueError('Rotation and Data are of different lengths.')
             
-        if self.scale is None:
-            self.scale = [1.0] * len(self.data)
+        if scales is None:
+            scales = [1.0] * len(self.data)
             
-        elif len(self.scale) != len(self.data):
+        elif len(scales) != len(self.data):
             raise ValueError('Scale and Data are of different lengths.')
         
-        elif all(i <= 1.0 for i in self.scale) is False or all(i > 0.0 for i in self.scale) is False:
+        elif all(i <= 1.0 for i in scales) is False or all(i > 0.0 for i in scales) is False:
             raise ValueError('Scale must be between 0 and 1.')
             
-        for child, rotation, scale in zip(self.data, self.rotation, self.scale):
+        for child, rotation, scale in zip(self.data, rotations, scales):
             if isinstance(child, str) is True:
                 tex += "\\includepdf[pages=1-, angle=" + str(rotation) + ", scale=" + str(scale) + "]{" + child + "}\n"
             else:
                 raise TypeError('Expected Pages items to be str.')
 
-        return tex + '\n'
-    
\ No newline at end of file
+        return [tex + '\n']
@@ -1,5 +1,6 @@
 from .base_classes.Container import Container
 from .base_classes.LatexPart import LatexPart
+from .base_classes.Lazy import Lazy
 
 class Section(Container):
     """
@@ -85,10 +86,18 @@ class Section(Container):
             self.add("\n\n\\" + self.type + "{" + section + "}\n\n")
 
     def add(self, child):
-        """Adds a LatexPart child to the Section container."""
+        """
+        Adds a LatexPart child to the Section container.
+
+        A callable returning a LatexPart is added as a Lazy part,
+        built only when the document's tex is generated.
+        """
         
         if isinstance(child, (LatexPart, Container)):
             self.add_child(child)
+
+        elif callable(child):
+            self.add_child(Lazy(child))
             
         else:
-            self.tex += child
+            LatexPart.add(self, child)
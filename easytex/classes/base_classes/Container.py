@@ -1,4 +1,208 @@
-from .LatexPart import LatexPart
+from .LatexPart import ChildList, LatexPart
+from .Lazy import Lazy
+
+
+# Chunks at least this long are cached by reference; shorter runs are joined.
+_SHARED_CHUNK_SIZE = 64 * 1024
+
+
+def _cache_pieces(chunks):
+    """
+    Returns chunks as a tuple for a Container's cache. Long chunks are the
+    parts' own strings, so the cache adds no copy of them.
+    """
+
+    pieces = []
+
+    run = []
+
+    for chunk in chunks:
+
+        if len(chunk) < _SHARED_CHUNK_SIZE:
+
+            run.append(chunk)
+
+            continue
+
+        if len(run) > 0:
+
+            pieces.append("".join(run))
+
+            run = []
+
+        pieces.append(chunk)
+
+    if len(run) > 0:
+        pieces.append("".join(run))
+
+    return tuple(pieces)
+
+
+def iter_part_tex(part, spans=None, offset=0, cache=True, parts=False):
+    """
+    Generator yielding the tex of any LatexPart in chunks.
+
+    Containers are expanded through their layout() method with an explicit
+    stack rather than recursion, so deeply nested trees cannot exceed the
+    recursion limit. Nothing in the part tree is modified, so the same tree
+    can be walked any number of times, including from several threads.
+
+    If part is a Container, its chunks are cached once walked and reused until
+    it or a part inside it changes (see LatexPart.invalidate), so re-exporting
+    a document after a small edit only walks the changed top-level parts.
+    Nested Containers are not cached separately, and long chunks are cached
+    by reference, so the cache holds no second copy of large tex.
+
+    Lazy parts are built when reached and dropped once their tex is yielded.
+    A Container holding one is not cached, so their tex is not kept either.
+    Spans cover the Lazy part only, not the parts it built.
+
+    Args
+    ----
+    part: LatexPart
+        The part to render.
+    spans: list
+        If given, (start, end, part) character ranges are appended to it.
+    offset: int
+        Number of characters emitted before part.
+    cache: bool
+        If False, part's render is not cached.
+    parts: bool
+        If True, a (part, containers) tuple is also yielded as each part is
+        reached, before its tex, where containers is a tuple of the Containers
+        enclosing it, outermost first. Parts built by Lazy parts are reported
+        in their place, so a single walk sees both the tex and the parts.
+
+    Returns:
+    offset: int
+        The generator's return value: offset plus the characters yielded.
+    """
+
+    # Items are tex strings, parts still to expand, or (start, version, part)
+    # markers closing a Container or, with version None, a Lazy part.
+    stack = [part]
+
+    # Everything emitted by this walk, to fill part's cache. None once no
+    # cache will be stored.
+    chunks = None
+
+    if cache is True and isinstance(part, Container) and part._rendered is None:
+        chunks = []
+
+    emitted = [] if spans is not None or chunks is not None else None
+
+    # Containers being expanded, for parts.
+    containers = []
+
+    # Number of Lazy parts being expanded.
+    lazies = 0
+
+    while stack:
+
+        item = stack.pop()
+
+        if isinstance(item, str):
+
+            yield item
+
+            if chunks is not None:
+                chunks.append(item)
+
+            offset += len(item)
+
+        elif isinstance(item, tuple):
+
+            start, version, container = item
+
+            if version is None:
+                lazies -= 1
+
+            elif parts is True:
+                containers.pop()
+
+            if emitted is not None and lazies == 0:
+                emitted.append((start, offset, container))
+
+            # Not cached if the part changed while it was being rendered.
+            if container is part and chunks is not None and container._version == version:
+                container._rendered = (
+                    _cache_pieces(chunks),
+                    offset - start,
+                    [(begin - start, end - start, inner) for begin, end, inner in emitted],
+                )
+
+        elif isinstance(item, Lazy):
+
+            stack.append((offset, None, item))
+
+            stack.append(item.build())
+
+            lazies += 1
+
+            # A Container holding a Lazy part is not cached.
+            chunks = None
+
+            if spans is None:
+                emitted = None
+
+        elif parts is True:
+
+            yield item, tuple(containers)
+
+            if isinstance(item, Container):
+
+                containers.append(item)
+
+                stack.append((offset, item._version, item))
+
+                stack.extend(reversed(item.layout()))
+
+            else:
+                stack.append(item.tex)
+
+                if emitted is not None and lazies == 0:
+                    emitted.append((offset, offset + len(item.tex), item))
+
+        elif isinstance(item, Container) and item._rendered is not None:
+
+            pieces, length, rendered_spans = item._rendered
+
+            yield from pieces
+
+            if chunks is not None:
+                chunks.extend(pieces)
+
+            if emitted is not None and lazies == 0:
+                emitted.extend(
+                    (offset + begin, offset + end, inner) for begin, end, inner in rendered_spans
+                )
+
+            offset += length
+
+        elif isinstance(item, Container):
+
+            stack.append((offset, item._version, item))
+
+            stack.extend(reversed(item.layout()))
+
+        else:
+
+            tex = item.tex
+
+            yield tex
+
+            if chunks is not None:
+                chunks.append(tex)
+
+            if emitted is not None and lazies == 0:
+                emitted.append((offset, offset + len(tex), item))
+
+            offset += len(tex)
+
+    if spans is not None:
+        spans.extend(emitted)
+
+    return offset
 
 
 class Container(LatexPart):
@@ -23,6 +227,21 @@ class Container(LatexPart):
         if child is not None:
             self.add_child(child)
 
+    @property
+    def children(self):
+        """
+        The contained LatexParts. Changing the list, or assigning a new one,
+        invalidates the Container's cached render.
+        """
+
+        return self._children
+
+    @children.setter
+    def children(self, children):
+
+        self._children = ChildList(self, children)
+
+        self.invalidate()
 
     def add_child(self, child):
         """
@@ -40,16 +259,17 @@ class Container(LatexPart):
         if isinstance(child, LatexPart) is False:
             raise TypeError("Child expected to be a Latex object or list of Latex objects.")
             
+        # The ChildList registers the Container as their parent and
+        # invalidates its cached render.
         if isinstance(child, list) is True:
-            for item in child:
-                self.children.append(item)
+            self.children.extend(child)
         else:
             self.children.append(child)
-        
-    def unpack(self, container):
+
+    def unpack(self, container, spans=None):
         """
-        Recursively checks passed Container and unpacks tex.
-        Repeats as long as the unpacked item is another Container instance.
+        Checks passed Container and unpacks tex, walking into every nested
+        Container (see iter_part_tex).
         This is how Containers within Containers within Containers are handled.
         
         Also properly closes any open Environment objects found.
@@ -58,39 +278,34 @@ class Container(LatexPart):
         ----
         container: LatexPart
             An object represeting either a LatexPart or Container.
+        spans: list
+            If given, a (start, end, part) character range within the
+            returned tex is appended for container and every nested part.
         
         Returns:
         tex: str
             A string of latex commands extracted from container.
         """
-        
-        tex = ""
-
-        if isinstance(container, Container):
-
-            tex = container.tex
-
-            for child in container.children:
-                
-                if isinstance(child, Container):
-                    tex += child.unpack(child)
-                    
-                else:
-                    tex += self.unpack(child)
 
-            commands = container.close_command
+        return "".join(iter_part_tex(container, spans))
 
-            commands.reverse()
-
-            commands = "".join(command for command in commands)
+    def layout(self):
+        """
+        Returns the Container's tex as a list of strings and child parts,
+        in order: its own tex, its children, then its closing commands.
 
-            tex += commands
+        Child parts are expanded by iter_part_tex. Subclasses override this
+        to lay their children out differently; it must not modify the part.
+        """
 
-        else:
-            tex += container.tex
+        return [self.tex] + list(self.children) + ["".join(reversed(self.close_command))]
 
-        return tex
+    def iter_tex(self, spans=None, offset=0):
+        """
+        Generator yielding the Container's tex in chunks (see iter_part_tex).
+        """
 
+        return (yield from iter_part_tex(self, spans, offset))
 
     def print_tex(self):
         """Unpacks the Container and prints its contents."""
@@ -1,3 +1,119 @@
+class ChildList(list):
+    """
+    A list a part renders from, such as a Container's children, that
+    invalidates the part's cached render (see LatexPart.invalidate) whenever
+    it is changed, e.g. section.children[0] = Text('...') or
+    env.children.append(part). LatexParts added to it are adopted by the part.
+    """
+
+    def __init__(self, owner, items=()):
+
+        list.__init__(self, items)
+
+        self._owner = owner
+
+        for item in self:
+            owner._adopt(item)
+
+    def __reduce_ex__(self, protocol):
+
+        # Rebuilt through __init__: pickle and deepcopy would otherwise add
+        # the items through append() before _owner is restored.
+        return ChildList, (self._owner, list(self))
+
+    def _changed(self, items=()):
+
+        for item in items:
+            self._owner._adopt(item)
+
+        self._owner.invalidate()
+
+    def __setitem__(self, i, item):
+
+        if isinstance(i, slice) is True:
+            item = list(item)
+
+        list.__setitem__(self, i, item)
+
+        self._changed(item if isinstance(i, slice) else [item])
+
+    def __delitem__(self, i):
+
+        list.__delitem__(self, i)
+
+        self._changed()
+
+    def __iadd__(self, items):
+
+        items = list(items)
+
+        list.__iadd__(self, items)
+
+        self._changed(items)
+
+        return self
+
+    def __imul__(self, n):
+
+        list.__imul__(self, n)
+
+        self._changed()
+
+        return self
+
+    def append(self, item):
+
+        list.append(self, item)
+
+        self._changed([item])
+
+    def insert(self, i, item):
+
+        list.insert(self, i, item)
+
+        self._changed([item])
+
+    def extend(self, items):
+
+        items = list(items)
+
+        list.extend(self, items)
+
+        self._changed(items)
+
+    def pop(self, i=-1):
+
+        item = list.pop(self, i)
+
+        self._changed()
+
+        return item
+
+    def remove(self, item):
+
+        list.remove(self, item)
+
+        self._changed()
+
+    def clear(self):
+
+        list.clear(self)
+
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+
+        list.sort(self, *args, **kwargs)
+
+        self._changed()
+
+    def reverse(self):
+
+        list.reverse(self)
+
+        self._changed()
+
+
 class LatexPart:
     """A base class represeting a set of latex commands."""
     
@@ -8,10 +124,133 @@ class LatexPart:
         tex: str
             A string representing latex commands to initialize in LatexPart.
         """
+
+        # Containers holding this part, told when its tex changes.
+        self._parents = []
+
+        # Cached (chunks, length, spans) of a Container's render, see iter_part_tex.
+        self._rendered = None
+
+        # Bumped on every change, so a render racing an edit is not cached.
+        self._version = 0
+
         self.close_command = []
 
         self.tex = "" + tex
 
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+
+        # The cached render is not copied or pickled, and neither are the
+        # Containers holding the part: those restored with it adopt it again.
+        state["_rendered"] = None
+
+        state["_parents"] = []
+
+        return state
+
+    def __copy__(self):
+        """
+        Returns a shallow copy of the part, holding the same children. Its
+        lists are its own, so changing the copy leaves the original as it is.
+        """
+
+        copied = self.__class__.__new__(self.__class__)
+
+        state = self.__getstate__()
+
+        for name, value in state.items():
+
+            if isinstance(value, ChildList) is True:
+                state[name] = ChildList(copied, value)
+
+        if state["_chunks"] is not None:
+            state["_chunks"] = list(state["_chunks"])
+
+        copied.__dict__.update(state)
+
+        return copied
+
+    @property
+    def close_command(self):
+        """
+        The commands closing the part's environments, closed in reverse
+        order. Changing the list, or assigning a new one, invalidates the
+        part's cached render.
+        """
+
+        return self._close_command
+
+    @close_command.setter
+    def close_command(self, close_command):
+
+        self._close_command = ChildList(self, close_command)
+
+        self.invalidate()
+
+    @property
+    def tex(self):
+        """
+        The part's latex commands as a single string.
+
+        Fragments added with ~.add() are kept in a list and joined here, once,
+        so building a large part takes linear rather than quadratic time.
+        """
+
+        if self._chunks is None:
+            return None
+
+        if len(self._chunks) != 1:
+            self._chunks = ["".join(self._chunks)]
+
+        return self._chunks[0]
+
+    @tex.setter
+    def tex(self, tex):
+
+        self._chunks = None if tex is None else [tex]
+
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Drops the cached render of this part and of every Container holding it,
+        up to the Document.
+
+        Called automatically when ~.tex, ~.close_command or a Container's
+        children change, and by the lists such as PDFs.rotation that parts
+        render from (see ChildList).
+        """
+
+        stack = [self]
+
+        seen = set()
+
+        while stack:
+
+            part = stack.pop()
+
+            if id(part) in seen:
+                continue
+
+            seen.add(id(part))
+
+            part._rendered = None
+
+            part._version += 1
+
+            stack.extend(part._parents)
+
+    def _adopt(self, child):
+        """Registers the part as a parent of child, for cache invalidation."""
+
+        # Compared by identity: Columns and PDFs compare equal by contents.
+        if isinstance(child, LatexPart) is True and all(
+            parent is not self for parent in child._parents
+        ):
+            child._parents.append(self)
+
     def add(self, tex):
         """
         Universal method for combining LatexParts.
@@ -24,17 +263,19 @@ class LatexPart:
         tex: str or LatexPart
             A string or LatexPart object.
         """
-        if self.tex is None:
+        if self._chunks is None:
 
-            self.tex = ""
+            self._chunks = []
 
         if isinstance(tex, LatexPart):
 
-            self.tex += tex.tex
+            self._chunks.append(tex.tex)
 
         else:
 
-            self.tex += tex
+            self._chunks.append(tex)
+
+        self.invalidate()
 
 
     def set_close_command(self, close_command):
@@ -44,9 +285,10 @@ class LatexPart:
         """
         commands = self.close_command
 
+        # The list invalidates the part's cached render.
         if type(close_command) == list:
 
-            self.close_command += close_command
+            self.close_command.extend(close_command)
         else:
 
             self.close_command.append(close_command)
@@ -0,0 +1,64 @@
+from .LatexPart import LatexPart
+
+
+class Lazy(LatexPart):
+    """
+    A placeholder for a LatexPart that is only built when the document's
+    tex is generated, and dropped again as soon as its tex is written.
+
+    Useful for large Tables: the DataFrame is loaded and the tex rendered
+    one table at a time, instead of holding every table in memory at once.
+
+    Document.add and Section.add wrap plain callables in a Lazy, e.g.
+    section.add(lambda: Table('table', 'sales', data=load_sales())).
+
+    The part is built again for every export. render_report builds it once
+    more, in a single walk that validates the document, collects its files
+    and aux seed, and hashes its tex (see Document._survey).
+    """
+
+    def __init__(self, factory, *args, **kwargs):
+        """
+        Args
+        ----
+        factory: callable
+            Called with args and kwargs to build the LatexPart,
+            e.g. a Table class or a function returning a Figure.
+        """
+
+        LatexPart.__init__(self)
+
+        if callable(factory) is False:
+            t = type(factory)
+            raise TypeError(f"Expected factory to be callable, got {t}.")
+
+        self.factory = factory
+
+        self.args = args
+
+        self.kwargs = kwargs
+
+        # Called with every built part, raising if it is not allowed where
+        # the Lazy was added (see Document.add).
+        self.checks = []
+
+    def build(self):
+        """
+        Builds and returns the LatexPart. The Lazy keeps no reference to it.
+        """
+
+        part = self.factory(*self.args, **self.kwargs)
+
+        if isinstance(part, LatexPart) is False or isinstance(part, Lazy) is True:
+            t = type(part)
+            raise TypeError(f"Lazy factory expected to return a LatexPart, got {t}.")
+
+        for check in self.checks:
+            check(part)
+
+        return part
+
+    def print_tex(self):
+        """Builds the part and prints its latex commands."""
+
+        self.build().print_tex()
@@ -0,0 +1,256 @@
+import os
+import re
+
+# \newlabel{name}{{number}{page}...
+_NEWLABEL_PATTERN = re.compile(r"^\\newlabel\{([^}]*)\}\{\{([^}]*)\}\{([^}]*)\}", re.MULTILINE)
+
+# \contentsline {kind}{\numberline {number}title}{page}{anchor}%
+_CONTENTSLINE_PATTERN = re.compile(
+    r"^\\contentsline \{(\w+)\}\{\\numberline \{([^}]*)\}.*\}\{([^{}]*)\}\{[^{}]*\}%?\s*$",
+    re.MULTILINE,
+)
+
+_LIST_EXTENSIONS = {"toc": ".toc", "lof": ".lof", "lot": ".lot"}
+
+_SECTION_LEVELS = ["section", "subsection", "subsubsection"]
+
+# Page number written for entries the previous build did not know about.
+UNKNOWN_PAGE = "?"
+
+
+def _read(path):
+
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as file:
+            return file.read()
+
+    except FileNotFoundError:
+        return ""
+
+
+def reference_state(directory, jobname):
+    """
+    Returns the numbers and pages latex resolved for labels and list entries.
+
+    Only the values that end up typeset are kept (not hyperref anchors or
+    formatting), so a seeded file and the file latex writes back compare equal
+    when the seed was right.
+
+    Returns:
+    state: tuple
+        (labels, entries) where labels is a sorted list of (name, number, page)
+        and entries is a list of (list, kind, number, page) in file order.
+    """
+
+    aux = _read(os.path.join(directory, jobname + ".aux"))
+
+    labels = sorted(_NEWLABEL_PATTERN.findall(aux))
+
+    entries = []
+
+    for name, extension in _LIST_EXTENSIONS.items():
+
+        text = _read(os.path.join(directory, jobname + extension))
+
+        for kind, number, page in _CONTENTSLINE_PATTERN.findall(text):
+            entries.append((name, kind, number, page))
+
+    return labels, entries
+
+
+def _previous_pages(directory, jobname):
+    """
+    Returns the page numbers of the previous build found in directory.
+
+    Returns:
+    labels, entries: dict, dict
+        Label name -> page, and (kind, number) -> page.
+    """
+
+    labels, entries = reference_state(directory, jobname)
+
+    label_pages = {name: page for name, _, page in labels}
+
+    entry_pages = {(kind, number): page for _, kind, number, page in entries}
+
+    return label_pages, entry_pages
+
+
+class EntryCollector:
+    """
+    Numbers sections, tables and figures the way latex will, one part at a
+    time in document order, so a walk made for other reasons can collect
+    them too (see Document._survey).
+
+    Attributes
+    ----------
+    labels: list
+        (name, number, title, anchor) tuples.
+    entries: list
+        (list, kind, number, title, anchor) tuples in document order,
+        where list is 'toc', 'lof' or 'lot'.
+    """
+
+    def __init__(self):
+
+        # Imported here to avoid a circular import: the classes import modules.
+        from ..classes.Section import Section
+        from ..classes.Table import Table
+        from ..classes.Figure import Figure
+
+        self._classes = Section, Table, Figure
+
+        self._sections = [0, 0, 0]
+
+        self._tables = 0
+
+        self._figures = 0
+
+        self.labels = []
+
+        self.entries = []
+
+    def add(self, part):
+        """Numbers part, if it is a Section or a captioned Table or Figure."""
+
+        Section, Table, Figure = self._classes
+
+        if isinstance(part, Section):
+
+            sections = self._sections
+
+            level = part.level - 1
+
+            sections[level] += 1
+
+            for deeper in range(level + 1, len(sections)):
+                sections[deeper] = 0
+
+            number = ".".join(str(count) for count in sections[: level + 1])
+
+            self.entries.append(
+                ("toc", part.type, number, part.name, part.type + "." + number)
+            )
+
+        elif isinstance(part, Table) and "\\caption" in part.tex:
+
+            self._tables += 1
+
+            number = str(self._tables)
+
+            self.entries.append(("lot", "table", number, part.caption, "table." + number))
+
+            if "\\label{" + part.label + "}" in part.tex:
+                self.labels.append((part.label, number, part.caption, "table." + number))
+
+        elif isinstance(part, Figure) and part.has_caption is True:
+
+            self._figures += 1
+
+            number = str(self._figures)
+
+            self.entries.append(("lof", "figure", number, part.caption, "figure." + number))
+
+            self.labels.append((part.label, number, part.caption, "figure." + number))
+
+
+def collect_entries(document):
+    """
+    Numbers the document's sections, tables and figures the way latex will.
+
+    Returns:
+    labels, entries: list, list
+        labels is a list of (name, number, title, anchor) tuples.
+        entries is a list of (list, kind, number, title, anchor) tuples in
+        document order, where list is 'toc', 'lof' or 'lot'.
+    """
+
+    collector = EntryCollector()
+
+    for part in document.iter_parts():
+        collector.add(part)
+
+    return collector.labels, collector.entries
+
+
+def write_seed(document, directory, jobname, entries=None):
+    """
+    Writes .toc, .lof, .lot and .aux files for document before latex runs.
+
+    Section numbers, list entries and label numbers come from the part tree,
+    so the first pass typesets them correctly. Page numbers are taken from
+    the previous build's files in directory, when present; entries it does
+    not know get UNKNOWN_PAGE and are corrected by a second pass.
+
+    Args
+    ----
+    document: Document
+        The document being compiled.
+    directory: str
+        The build directory.
+    jobname: str
+        The tex file name without its extension.
+    entries: tuple
+        The document's (labels, entries) if already collected, see
+        collect_entries. Saves walking, and building Lazy parts, again.
+
+    Returns:
+    state: tuple
+        The reference_state() the seeded files describe.
+    """
+
+    label_pages, entry_pages = _previous_pages(directory, jobname)
+
+    if entries is None:
+        entries = collect_entries(document)
+
+    labels, entries = entries
+
+    # Keep the previous build's labels for parts the tree does not describe,
+    # e.g. \label commands inside raw LatexParts.
+    known = set(name for name, _, _, _ in labels)
+
+    kept = [
+        line
+        for line in _read(os.path.join(directory, jobname + ".aux")).split("\n")
+        if line.startswith("\\newlabel{")
+        and line[len("\\newlabel{"):].split("}")[0] not in known
+    ]
+
+    lists = {name: [] for name in _LIST_EXTENSIONS}
+
+    for name, kind, number, title, anchor in entries:
+
+        page = entry_pages.get((kind, number), UNKNOWN_PAGE)
+
+        if name == "toc":
+            text = "\\numberline {" + number + "}" + title
+
+        else:
+            text = "\\numberline {" + number + "}{\\ignorespaces " + title + "}"
+
+        lists[name].append(
+            "\\contentsline {" + kind + "}{" + text + "}{" + page + "}{" + anchor + "}%\n"
+        )
+
+    for name, extension in _LIST_EXTENSIONS.items():
+        with open(os.path.join(directory, jobname + extension), "w") as file:
+            file.write("".join(lists[name]))
+
+    with open(os.path.join(directory, jobname + ".aux"), "w") as file:
+
+        file.write("\\relax \n")
+
+        for line in kept:
+            file.write(line + "\n")
+
+        for name, number, title, anchor in labels:
+
+            page = label_pages.get(name, UNKNOWN_PAGE)
+
+            file.write(
+                "\\newlabel{" + name + "}{{" + number + "}{" + page + "}{"
+                + title + "}{" + anchor + "}{}}\n"
+            )
+
+    return reference_state(directory, jobname)
@@ -0,0 +1,347 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-flight only within the process.
+    fcntl = None
+
+# Seconds between attempts of PDFCache.lock_async on a lock held elsewhere.
+LOCK_POLL_INTERVAL = 0.05
+
+
+class PDFCache:
+    """
+    A content-addressed cache of rendered pdfs.
+
+    Entries are keyed on the final tex plus the bytes of every file it
+    references, so an unchanged report is never compiled twice. The cache
+    directory is kept under max_bytes by evicting least recently used entries.
+    Concurrent renders of the same key, from threads or other processes,
+    are collapsed into a single compile by PDFCache.lock().
+    """
+
+    def __init__(self, directory, max_bytes=1024 ** 3):
+        """
+        Args
+        ----
+        directory: str
+            Directory where cached pdfs are stored.
+        max_bytes: int
+            Maximum total size of cached pdfs, in bytes.
+        """
+
+        if isinstance(max_bytes, int) is False or max_bytes <= 0:
+            raise ValueError("max_bytes should be a positive int.")
+
+        self.directory = os.path.abspath(directory)
+
+        self.max_bytes = max_bytes
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._locks = {}
+
+        # asyncio.Locks queueing lock_async callers, per event loop and key.
+        self._async_locks = {}
+
+        self._locks_guard = threading.Lock()
+
+    def key(self, tex, files=(), salt=""):
+        """
+        Returns the cache key for a document.
+
+        Args
+        ----
+        tex: str or iterable
+            The document's complete tex, its chunks (see Document.iter_tex),
+            or a digest of it.
+        files: list
+            Paths of files the tex references. Missing files are hashed by name.
+        salt: str
+            Extra text that changes the output, e.g. the engine name.
+        """
+
+        digest = hashlib.sha256()
+
+        digest.update(salt.encode("utf-8") + b"\0")
+
+        if isinstance(tex, str):
+            tex = [tex]
+
+        for chunk in tex:
+            digest.update(chunk.encode("utf-8"))
+
+        digest.update(b"\0")
+
+        for path in files:
+
+            digest.update(str(path).encode("utf-8") + b"\0")
+
+            try:
+                with open(path, "rb") as file:
+                    for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                        digest.update(chunk)
+
+            except (FileNotFoundError, IsADirectoryError, TypeError):
+                digest.update(b"<missing>")
+
+            digest.update(b"\0")
+
+        return digest.hexdigest()
+
+    def _path(self, key):
+
+        return os.path.join(self.directory, key + ".pdf")
+
+    def get(self, key):
+        """
+        Returns the path of the cached pdf for key, or None on a miss.
+        A hit marks the entry as recently used.
+        """
+
+        path = self._path(key)
+
+        try:
+            os.utime(path)
+
+        except FileNotFoundError:
+            return None
+
+        return path
+
+    def put(self, key, pdf_file):
+        """
+        Copies pdf_file into the cache under key and evicts old entries.
+
+        Returns:
+        path: str
+            The path of the cached pdf.
+        """
+
+        handle, temporary = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+
+        os.close(handle)
+
+        try:
+            shutil.copyfile(pdf_file, temporary)
+
+            os.replace(temporary, self._path(key))
+
+        except BaseException:
+            os.remove(temporary)
+
+            raise
+
+        self.evict()
+
+        return self._path(key)
+
+    def evict(self):
+        """Removes least recently used pdfs until the cache fits in max_bytes."""
+
+        entries = []
+
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(".pdf"):
+                    try:
+                        stat = entry.stat()
+
+                    except FileNotFoundError:
+                        continue
+
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+
+            except FileNotFoundError:
+                pass
+
+            total -= size
+
+    @contextmanager
+    def lock(self, key):
+        """
+        Holds an exclusive lock on key, across threads and processes.
+
+        Renders wrap their cache lookup and compile in this lock, so
+        concurrent identical requests wait for the first compile and
+        then hit the cache instead of compiling again.
+        """
+
+        entry = self._lock_entry(key)
+
+        try:
+            with entry[0]:
+                with self._file_lock(key):
+                    yield
+
+        finally:
+            self._release_entry(key, entry)
+
+    @asynccontextmanager
+    async def lock_async(self, key):
+        """
+        Awaitable version of PDFCache.lock().
+
+        Renders of the same key on the event loop queue on an asyncio.Lock.
+        The first one then polls the thread and file locks without blocking,
+        so no executor thread waits on them and a cancelled render never
+        leaves them held.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        with self._locks_guard:
+            waiters = self._async_locks.setdefault((loop, key), [asyncio.Lock(), 0])
+
+            waiters[1] += 1
+
+        try:
+            async with waiters[0]:
+
+                entry = self._lock_entry(key)
+
+                try:
+                    while entry[0].acquire(blocking=False) is False:
+                        await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+                    try:
+                        async with self._file_lock_async(key):
+                            yield
+
+                    finally:
+                        entry[0].release()
+
+                finally:
+                    self._release_entry(key, entry)
+
+        finally:
+            with self._locks_guard:
+                waiters[1] -= 1
+
+                if waiters[1] == 0:
+                    del self._async_locks[(loop, key)]
+
+    def _lock_entry(self, key):
+        """Returns the [threading.Lock, users] entry of key, counting one more user."""
+
+        with self._locks_guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+
+            entry[1] += 1
+
+        return entry
+
+    def _release_entry(self, key, entry):
+
+        with self._locks_guard:
+            entry[1] -= 1
+
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def _lock_file(self, key, blocking=True):
+        """
+        Returns key's lock file, opened and flocked, or None if blocking is
+        False and it is locked elsewhere.
+
+        Lock files are removed when released (see _unlock_file), so the file
+        may be removed between opening and locking it: it is then opened again.
+        """
+
+        path = os.path.join(self.directory, key + ".lock")
+
+        flags = fcntl.LOCK_EX if blocking is True else fcntl.LOCK_EX | fcntl.LOCK_NB
+
+        while True:
+
+            file = open(path, "a")
+
+            try:
+                fcntl.flock(file, flags)
+
+            except BlockingIOError:
+
+                file.close()
+
+                return None
+
+            except BaseException:
+
+                file.close()
+
+                raise
+
+            try:
+                locked = os.path.samestat(os.stat(path), os.fstat(file.fileno()))
+
+            except FileNotFoundError:
+                locked = False
+
+            if locked is True:
+                return file
+
+            file.close()
+
+    def _unlock_file(self, file):
+        """Removes and unlocks a file returned by _lock_file."""
+
+        try:
+            # Removed while still locked, so later lockers open a new file.
+            os.remove(file.name)
+
+        except FileNotFoundError:
+            pass
+
+        file.close()
+
+    @contextmanager
+    def _file_lock(self, key):
+
+        if fcntl is None:
+            yield
+            return
+
+        file = self._lock_file(key)
+
+        try:
+            yield
+
+        finally:
+            self._unlock_file(file)
+
+    @asynccontextmanager
+    async def _file_lock_async(self, key):
+
+        if fcntl is None:
+            yield
+            return
+
+        file = self._lock_file(key, blocking=False)
+
+        while file is None:
+
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+            file = self._lock_file(key, blocking=False)
+
+        try:
+            yield
+
+        finally:
+            self._unlock_file(file)
@@ -0,0 +1,464 @@
+import hashlib
+import os
+import re
+import time
+
+from .runner import PassResult, run_tex, run_tex_async
+
+# Flags that stop latex from ever waiting on stdin.
+NONINTERACTIVE_FLAGS = ["-interaction=nonstopmode", "-halt-on-error"]
+
+
+# Date used for reproducible output when SOURCE_DATE_EPOCH is not set.
+DEFAULT_SOURCE_DATE_EPOCH = 0
+
+
+def reproducible_env(source_date_epoch=None):
+    """
+    Returns an environment that pins the dates TeX writes into a pdf.
+
+    SOURCE_DATE_EPOCH fixes the creation and modification dates (and, see
+    XeLaTeX.finalize, the trailer id of xdvipdfmx); FORCE_SOURCE_DATE=1
+    also fixes \\today.
+
+    Args
+    ----
+    source_date_epoch: int
+        Seconds since the epoch. Defaults to the SOURCE_DATE_EPOCH
+        environment variable, or DEFAULT_SOURCE_DATE_EPOCH.
+    """
+
+    if source_date_epoch is None:
+        source_date_epoch = os.environ.get("SOURCE_DATE_EPOCH", DEFAULT_SOURCE_DATE_EPOCH)
+
+    env = dict(os.environ)
+
+    env["SOURCE_DATE_EPOCH"] = str(source_date_epoch)
+
+    env["FORCE_SOURCE_DATE"] = "1"
+
+    return env
+
+
+# Warnings emitted by latex, longtable, hyperref/rerunfilecheck etc.
+# when another pass is required to settle references.
+_RERUN_PATTERN = re.compile(
+    r"(Rerun to get|Rerun LaTeX|Please rerun|Please \(re\)run|rerun needed)",
+    re.IGNORECASE,
+)
+
+
+def rerun_requested(log):
+    """
+    Returns True if a latex log contains a warning asking for another pass.
+
+    Args
+    ----
+    log: str
+        The contents of a latex .log file.
+    """
+
+    return _RERUN_PATTERN.search(log) is not None
+
+
+class Engine:
+    """
+    Base class for a TeX engine used by compile_tex.
+
+    Subclasses set the executable and extra flags and may override
+    needs_rerun() to decide, from a pass's log, whether another pass is needed.
+
+    Passes that are known not to be the last run in draft mode (draft_flags),
+    which skips writing the pdf and embedding images and fonts. Engines with
+    finalizes_drafts set run every pass in draft mode and produce the pdf
+    from the last pass's output in finalize().
+    """
+
+    name = None
+
+    executable = None
+
+    flags = NONINTERACTIVE_FLAGS
+
+    # Flags for a pass whose pdf output is not needed.
+    draft_flags = []
+
+    # Whether finalize() turns a draft pass's output into the final pdf.
+    finalizes_drafts = False
+
+    # Whether the engine can start from a mylatexformat preamble dump.
+    supports_formats = True
+
+    def command(self, tex_file, output_directory=None, format_file=None, draft=False):
+        """
+        Returns the command line for one pass.
+
+        Args
+        ----
+        tex_file: str
+            The tex file to compile.
+        output_directory: str
+            Directory the engine writes to, or None for the working directory.
+        format_file: str
+            Optional precompiled format to start from.
+        draft: bool
+            True to skip writing the pdf.
+        """
+
+        command = [self.executable] + list(self.flags)
+
+        if draft is True:
+            command += self.draft_flags
+
+        if format_file is not None:
+            command.append("-fmt=" + format_file)
+
+        if output_directory is not None:
+            command.append("-output-directory=" + output_directory)
+
+        return command + [tex_file]
+
+    def needs_rerun(self, log):
+        """Returns True if the log of a pass asks for another pass."""
+
+        return rerun_requested(log)
+
+    def reproducible_tex(self, digest):
+        """
+        Returns tex, placed on the \\begin{document} line, that pins the pdf
+        trailer id to digest (a hex string), or "" if the engine does not
+        need it. The tex must not contain a newline.
+        """
+
+        return ""
+
+    def run_pass(
+        self, tex_file, output_directory=None, format_file=None, draft=False, **kwargs
+    ):
+        """
+        Runs one pass and returns its PassResult.
+        Extra keyword arguments are passed on to runner.run_tex.
+        """
+
+        return run_tex(
+            self.command(tex_file, output_directory, format_file, draft), **kwargs
+        )
+
+    async def run_pass_async(
+        self, tex_file, output_directory=None, format_file=None, draft=False, **kwargs
+    ):
+        """Awaitable version of Engine.run_pass."""
+
+        return await run_tex_async(
+            self.command(tex_file, output_directory, format_file, draft), **kwargs
+        )
+
+    def finalize_command(self, tex_file, output_directory=None):
+        """Returns the command turning draft output into a pdf, or None."""
+
+        return None
+
+    def finalize(self, tex_file, output_directory=None, **kwargs):
+        """
+        Produces the pdf from the last draft pass, if the engine needs to.
+
+        The finalize command runs in the working directory, like the passes,
+        so image paths recorded relative to it by the engine still resolve.
+
+        Returns:
+        result: PassResult
+            The finalizing step, or None if there is none.
+        """
+
+        command = self.finalize_command(tex_file, output_directory)
+
+        if command is None:
+            return None
+
+        return run_tex(command, **kwargs)
+
+    async def finalize_async(self, tex_file, output_directory=None, **kwargs):
+        """Awaitable version of Engine.finalize."""
+
+        command = self.finalize_command(tex_file, output_directory)
+
+        if command is None:
+            return None
+
+        return await run_tex_async(command, **kwargs)
+
+    def __repr__(self):
+
+        return f"{type(self).__name__}()"
+
+
+class XeLaTeX(Engine):
+    """xelatex: native unicode and system fonts through fontspec."""
+
+    name = "xelatex"
+
+    executable = "xelatex"
+
+    # xelatex normally pipes its .xdv through xdvipdfmx itself; with -no-pdf
+    # every pass stops at the .xdv and xdvipdfmx runs once at the end,
+    # from the same working directory so relative image paths resolve.
+    draft_flags = ["-no-pdf"]
+
+    finalizes_drafts = True
+
+    def finalize_command(self, tex_file, output_directory=None):
+
+        stem = os.path.splitext(os.path.basename(tex_file))[0]
+
+        output = os.path.abspath(os.path.join(output_directory or ".", stem))
+
+        return ["xdvipdfmx", "-q", "-o", output + ".pdf", output + ".xdv"]
+
+    def finalize(self, tex_file, output_directory=None, **kwargs):
+
+        result = Engine.finalize(self, tex_file, output_directory, **kwargs)
+
+        self._pin_trailer_id(tex_file, output_directory, kwargs.get("env"))
+
+        return result
+
+    async def finalize_async(self, tex_file, output_directory=None, **kwargs):
+
+        result = await Engine.finalize_async(self, tex_file, output_directory, **kwargs)
+
+        self._pin_trailer_id(tex_file, output_directory, kwargs.get("env"))
+
+        return result
+
+    def _pin_trailer_id(self, tex_file, output_directory, env):
+        """
+        Replaces the pdf's trailer id when dates are pinned (see reproducible_env).
+
+        xdvipdfmx hashes its file names into the id, and those include the
+        random build directory; the id is derived from the pdf's contents instead.
+        """
+
+        if env is None or "SOURCE_DATE_EPOCH" not in env:
+            return
+
+        stem = os.path.splitext(os.path.basename(tex_file))[0]
+
+        pin_trailer_id(os.path.join(output_directory or ".", stem + ".pdf"))
+
+
+_TRAILER_ID_PATTERN = re.compile(rb"/ID\s*\[\s*<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>\s*\]")
+
+
+def pin_trailer_id(pdf_file):
+    """
+    Rewrites the /ID of a pdf in place with a hash of the rest of the file,
+    so identical pdfs get identical ids. The id keeps its length, so no
+    offset in the file moves. Files without an id are left unchanged.
+    """
+
+    with open(pdf_file, "rb") as file:
+        pdf = file.read()
+
+    matches = list(_TRAILER_ID_PATTERN.finditer(pdf))
+
+    if len(matches) == 0:
+        return
+
+    # Every id is blanked before hashing, so the hash does not depend on them.
+    blanked = _TRAILER_ID_PATTERN.sub(b"/ID []", pdf)
+
+    digest = hashlib.sha256(blanked).hexdigest().upper().encode("ascii")
+
+    pieces = []
+
+    position = 0
+
+    for match in matches:
+
+        for group in (1, 2):
+
+            pieces.append(pdf[position:match.start(group)])
+
+            length = match.end(group) - match.start(group)
+
+            pieces.append((digest * (length // len(digest) + 1))[:length])
+
+            position = match.end(group)
+
+    pieces.append(pdf[position:])
+
+    with open(pdf_file, "wb") as file:
+        file.write(b"".join(pieces))
+
+
+class PDFLaTeX(Engine):
+    """pdflatex: the fastest engine for documents that do not need fontspec."""
+
+    name = "pdflatex"
+
+    executable = "pdflatex"
+
+    draft_flags = ["-draftmode"]
+
+    def reproducible_tex(self, digest):
+
+        return "\\pdftrailerid{" + digest + "}\\pdfsuppressptexinfo=-1 "
+
+
+class LuaLaTeX(Engine):
+    """lualatex: dynamic memory allocation, for documents beyond TeX's fixed capacity."""
+
+    name = "lualatex"
+
+    executable = "lualatex"
+
+    draft_flags = ["-draftmode"]
+
+    # mylatexformat cannot dump LuaTeX's callback state.
+    supports_formats = False
+
+    def reproducible_tex(self, digest):
+
+        digest = digest[:32]
+
+        return "\\pdfvariable trailerid {[<" + digest + "> <" + digest + ">]}"
+
+
+# A one page, blank pdf.
+_PLACEHOLDER_PDF_OBJECTS = [
+    b"<< /Type /Catalog /Pages 2 0 R >>",
+    b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+    b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>",
+]
+
+
+def _placeholder_pdf():
+    """Returns the bytes of a minimal, valid, one page pdf."""
+
+    pdf = bytearray(b"%PDF-1.4\n")
+
+    offsets = []
+
+    for number, body in enumerate(_PLACEHOLDER_PDF_OBJECTS, start=1):
+
+        offsets.append(len(pdf))
+
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+
+    xref = len(pdf)
+
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1)
+
+    for offset in offsets:
+        pdf += b"%010d 00000 n \n" % offset
+
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(offsets) + 1,
+        xref,
+    )
+
+    return bytes(pdf)
+
+
+class StubEngine(Engine):
+    """
+    A fake engine that never starts a process.
+
+    Each pass writes a placeholder pdf, plus an .aux with a \\newlabel per
+    \\label and a .log with the page count. This lets callers measure and
+    test the Python side at full speed without a TeX installation.
+    """
+
+    name = "stub"
+
+    executable = "stub"
+
+    supports_formats = False
+
+    _label_pattern = re.compile(r"\\label\{([^}]*)\}")
+
+    # Like xelatex, passes leave the pdf to finalize().
+    finalizes_drafts = True
+
+    def run_pass(
+        self, tex_file, output_directory=None, format_file=None, draft=False, **kwargs
+    ):
+
+        start = time.monotonic()
+
+        directory = output_directory or "."
+
+        jobname = os.path.splitext(os.path.basename(tex_file))[0]
+
+        with open(tex_file, "r") as file:
+            tex = file.read()
+
+        pages = tex.count("\\clearpage") + 1
+
+        with open(os.path.join(directory, jobname + ".aux"), "w") as file:
+
+            file.write("\\relax \n")
+
+            for number, label in enumerate(self._label_pattern.findall(tex), start=1):
+                file.write("\\newlabel{%s}{{%d}{1}}\n" % (label, number))
+
+        with open(os.path.join(directory, jobname + ".log"), "w") as file:
+            file.write(
+                "This is StubEngine.\nOutput written on %s.pdf (%d page%s, 0 bytes).\n"
+                % (jobname, pages, "" if pages == 1 else "s")
+            )
+
+        if draft is False:
+            self.finalize(tex_file, output_directory)
+
+        return PassResult("", time.monotonic() - start)
+
+    async def run_pass_async(
+        self, tex_file, output_directory=None, format_file=None, draft=False, **kwargs
+    ):
+
+        return self.run_pass(tex_file, output_directory, format_file, draft, **kwargs)
+
+    def finalize(self, tex_file, output_directory=None, **kwargs):
+
+        start = time.monotonic()
+
+        stem = os.path.splitext(os.path.basename(tex_file))[0]
+
+        with open(os.path.join(output_directory or ".", stem + ".pdf"), "wb") as file:
+            file.write(_placeholder_pdf())
+
+        return PassResult("", time.monotonic() - start)
+
+    async def finalize_async(self, tex_file, output_directory=None, **kwargs):
+
+        return self.finalize(tex_file, output_directory, **kwargs)
+
+
+ENGINES = {
+    "xelatex": XeLaTeX,
+    "pdflatex": PDFLaTeX,
+    "lualatex": LuaLaTeX,
+    "stub": StubEngine,
+}
+
+
+def get_engine(engine):
+    """
+    Returns an Engine instance.
+
+    Args
+    ----
+    engine: str or Engine
+        An engine name from ENGINES, or an Engine instance.
+    """
+
+    if isinstance(engine, Engine):
+        return engine
+
+    if engine not in ENGINES:
+        names = ", ".join(sorted(ENGINES))
+
+        raise ValueError(f"engine must be one of {names} or an Engine, got {engine!r}.")
+
+    return ENGINES[engine]()
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+
+from .engines import NONINTERACTIVE_FLAGS
+from .runner import run_tex
+
+# Marks the end of the precompilable part of a preamble (see parts/preamble.tex).
+# mylatexformat stops dumping here; without a format it expands to \relax.
+DUMP_MARKER = "\\csname endofdump\\endcsname"
+
+_engine_versions = {}
+
+
+def static_preamble(preamble):
+    """
+    Returns the part of preamble before DUMP_MARKER, or None if it has no marker.
+
+    Args
+    ----
+    preamble: str
+        A complete latex preamble.
+    """
+
+    end = preamble.find(DUMP_MARKER)
+
+    if end == -1:
+        return None
+
+    return preamble[:end]
+
+
+def engine_version(engine):
+    """Returns the first line of `engine --version`, cached per process."""
+
+    if engine not in _engine_versions:
+
+        output = subprocess.run(
+            [engine, "--version"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            check=True,
+        ).stdout
+
+        _engine_versions[engine] = output.decode("utf-8", errors="replace").split("\n")[0]
+
+    return _engine_versions[engine]
+
+
+def format_key(static_tex, engine):
+    """
+    Returns the cache key for a format: a hash of the static preamble and the
+    engine version, so a TeX upgrade or preamble change builds a new format.
+    """
+
+    digest = hashlib.sha1()
+
+    digest.update(engine_version(engine).encode("utf-8"))
+
+    digest.update(b"\0")
+
+    digest.update(static_tex.encode("utf-8"))
+
+    return engine + "-" + digest.hexdigest()
+
+
+def dump_format(static_tex, engine, cache_dir, timeout=None):
+    """
+    Returns a format file for static_tex, dumping it into cache_dir if needed.
+
+    The format is built with mylatexformat. Documents compiled against it skip
+    their preamble up to DUMP_MARKER, so the packages loaded there are read
+    from the format instead of being parsed again on every pass.
+
+    Args
+    ----
+    static_tex: str
+        The preamble up to (not including) DUMP_MARKER.
+    engine: str
+        The latex executable, e.g. 'xelatex'.
+    cache_dir: str
+        Directory where formats are kept.
+    timeout: float
+        Seconds the dump may take before the engine is killed.
+
+    Returns:
+    path: str
+        Path of the format without its .fmt extension, suitable for -fmt=.
+    """
+
+    cache_dir = os.path.abspath(cache_dir)
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    key = format_key(static_tex, engine)
+
+    path = os.path.join(cache_dir, key)
+
+    if os.path.exists(path + ".fmt"):
+        return path
+
+    # Dump into a private directory and rename into place, so concurrent
+    # renders never load a half written format.
+    work_dir = tempfile.mkdtemp(prefix="easytex-fmt-", dir=cache_dir)
+
+    try:
+        source = os.path.join(work_dir, key + ".tex")
+
+        with open(source, "w") as file:
+            file.write(static_tex + DUMP_MARKER + "\n")
+
+        run_tex(
+            [engine]
+            + NONINTERACTIVE_FLAGS
+            + [
+                "-ini",
+                "-jobname=" + key,
+                "-output-directory=" + work_dir,
+                "&" + engine,
+                "mylatexformat.ltx",
+                source,
+            ],
+            timeout=timeout,
+        )
+
+        os.replace(os.path.join(work_dir, key + ".fmt"), path + ".fmt")
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return path
@@ -0,0 +1,513 @@
+import bisect
+import re
+from collections import namedtuple
+
+# A node of the generated tex: kind is one of the _NODE_PATTERN group names
+# other than "command", "verbatim", or "text" for anything in between,
+# including other control sequences. start is its offset in the parsed buffer.
+Node = namedtuple("Node", ["kind", "text", "start"])
+
+_NODE_PATTERN = re.compile(
+    r"(?P<comment>%[^\n]*)"
+    r"|(?P<verb>\\verb\*?(?P<delimiter>[^a-zA-Z\s*])[^\n]*?(?P=delimiter))"
+    r"|(?P<begin>\\begin\{(?P<begin_name>[^}]*)\})"
+    r"|(?P<end>\\end\{(?P<end_name>[^}]*)\})"
+    r"|(?P<rulecolor>\\arrayrulecolor(?:\[[^\]]*\])?\{[^}]*\})"
+    r"|(?P<rowcolors>\\rowcolors\*?(?:\[[^\]]*\])?\{[^}]*\}\{(?P<odd>[^}]*)\}\{(?P<even>[^}]*)\})"
+    r"|(?P<hfill>\\hfill(?![a-zA-Z]))"
+    r"|(?P<blank>[ \t]*\n(?:[ \t]*\n)+[ \t]*)"
+    # Runs of anything else, control symbols included so \% and \\ are not
+    # mistaken for comments.
+    r"|(?P<command>(?:[^\\%\n]+|\\[^a-zA-Z]|\n(?![ \t]*\n)"
+    r"|\\(?!(?:begin|end|hfill|arrayrulecolor|rowcolors|verb)(?![a-zA-Z]))[a-zA-Z]+)+)",
+    re.DOTALL,
+)
+
+# Environments whose contents are written out as-is and never optimized.
+VERBATIM_ENVIRONMENTS = ["verbatim", "verbatim*", "Verbatim", "lstlisting", "minted"]
+
+# Environments that leave TeX in vertical mode, where an empty line is harmless.
+_VERTICAL_ENVIRONMENTS = ["table", "table*", "longtable", "sidewaystable"]
+
+_REST_OF_LINE_BLANK = re.compile(r"[ \t]*(\n|$)")
+
+_BLANK_LINE_FOLLOWS = re.compile(r"[ \t]*\n[ \t]*\n")
+
+_LINE_START = re.compile(r"(^|\n)[ \t]*$")
+
+_ENDS_WITH_CONTROL_WORD = re.compile(r"\\[a-zA-Z]+$")
+
+_BLANK_LINE = "\n\n"
+
+# Environments whose column specification may draw vertical rules.
+_TABULAR_ENVIRONMENTS = ["tabular", "tabular*", "tabularx", "tabulary", "longtable", "array"]
+
+# Kinds of node that draw no rule, unless a "text" one matches _DRAWS_RULE.
+_RULE_FREE_KINDS = ["text", "comment", "blank", "hfill", "rowcolors", "rulecolor"]
+
+# Rule commands, commands replaying rows that may hold some (longtable's
+# \endhead and the like), and vertical rules in a column specification.
+_DRAWS_RULE = re.compile(
+    r"\||!\{|\\(?:[a-zA-Z]*(?:rule|line)|end(?:first)?head|end(?:last)?foot)(?![a-zA-Z])"
+)
+
+# Output held back in case an \arrayrulecolor is superseded is released
+# anyway, and the command kept, once it is this long.
+_HOLD_LIMIT = 64 * 1024
+
+# Number of nodes written, within a chunk, between two releases of output.
+_RELEASE_SIZE = 4096
+
+
+def parse_nodes(buffer, final=True):
+    """
+    Splits tex into Nodes.
+
+    A verbatim environment becomes a single "verbatim" node. Without final,
+    the buffer is only parsed up to the start of its last line of content,
+    so no node is cut in two by the end of a chunk.
+
+    Args
+    ----
+    buffer: str
+        The tex to parse.
+    final: bool
+        True if no more tex follows buffer.
+
+    Returns:
+    nodes, consumed: list, int
+        The nodes, and the number of characters of buffer they cover.
+    """
+
+    nodes = []
+
+    scan = iter_nodes(buffer, final)
+
+    while True:
+
+        try:
+            nodes.append(next(scan))
+
+        except StopIteration as stop:
+            return nodes, stop.value
+
+
+def iter_nodes(buffer, final=True):
+    """
+    Generator version of parse_nodes, yielding the Nodes one at a time so a
+    large buffer is never held as a list of them. The number of characters
+    of buffer they cover is its return value (StopIteration.value).
+    """
+
+    limit = len(buffer)
+
+    if final is False:
+
+        limit = buffer.rfind("\n")
+
+        while limit >= 0 and (limit + 1 == len(buffer) or buffer[limit + 1] in " \t\n"):
+            limit = buffer.rfind("\n", 0, limit)
+
+        limit += 1
+
+    position = 0
+
+    # Start of the text not yet in a node.
+    text_start = 0
+
+    matches = _NODE_PATTERN.finditer(buffer)
+
+    while True:
+
+        match = next(matches, None)
+
+        if match is None or match.start() >= limit:
+            break
+
+        kind = match.lastgroup
+
+        end = match.end()
+
+        # Other control sequences are only matched to be skipped over.
+        if kind == "command":
+            continue
+
+        start = match.start()
+
+        if start > text_start:
+            yield Node("text", buffer[text_start:start], text_start)
+
+        name = match.group("begin_name") if kind == "begin" else None
+
+        if name in VERBATIM_ENVIRONMENTS:
+
+            close = buffer.find("\\end{" + name + "}", end)
+
+            if close == -1 and final is False:
+                return start
+
+            end = len(buffer) if close == -1 else close + len("\\end{" + name + "}")
+
+            kind = "verbatim"
+
+            # Its contents are not parsed.
+            matches = _NODE_PATTERN.finditer(buffer, end)
+
+        yield Node(kind, buffer[start:end], start)
+
+        position = end
+
+        text_start = end
+
+    # A control sequence may run past limit, e.g. one ending the buffer.
+    position = max(position, limit)
+
+    if position > text_start:
+        yield Node("text", buffer[text_start:position], text_start)
+
+    return position
+
+
+class _Peephole:
+    """State of an optimize_chunks pass, carried from one chunk to the next."""
+
+    def __init__(self):
+
+        self.depth = 0
+
+        # (command, depth) of the \arrayrulecolor and single-colour \rowcolors
+        # in effect, while the environment they were given in is still open.
+        self.rulecolor = None
+
+        self.rowcolors = None
+
+        # Name of the environment ended by the last non-space node, if any.
+        self.last_end = None
+
+        # The last characters written, to look behind a node.
+        self.tail = ""
+
+        # (text, start, end) of the nodes written and not yet released: the
+        # text kept of the input's characters start to end.
+        self.output = []
+
+        # (index in output, rulecolor, tail, last_end) of an \arrayrulecolor
+        # no rule has been drawn with yet, and the state before it, so it can
+        # be dropped if another one follows.
+        self.pending = None
+
+        # True if the next node may hold a tabular's column specification.
+        self.spec_follows = False
+
+        # Depth of the innermost tabular with vertical rules, which are drawn
+        # on every row, if any.
+        self.vertical_rules = None
+
+    def write(self, buffer, node, start):
+        """Adds the text to write for node, at start in the input, to output."""
+
+        kind = node.kind
+
+        if self.pending is not None:
+
+            if kind == "rulecolor":
+                self._supersede()
+
+            elif kind not in _RULE_FREE_KINDS or (
+                kind == "text" and _DRAWS_RULE.search(node.text) is not None
+            ):
+                self.pending = None
+
+        state = None
+
+        if kind == "rulecolor" and self.vertical_rules is None and self._droppable(buffer, node) is True:
+            state = (len(self.output), self.rulecolor, self.tail, self.last_end)
+
+        kept = self.keep(buffer, node)
+
+        if state is not None and kept != "":
+            self.pending = state
+
+        self.output.append((kept, start, start + len(node.text)))
+
+        if kept != "":
+            self.tail = (self.tail + kept[-64:])[-64:]
+
+    def release(self, final):
+        """
+        Returns the (text, start, end) output that can no longer change,
+        and removes it from output.
+        """
+
+        held = len(self.output)
+
+        if self.pending is not None and final is False:
+
+            held = self.pending[0]
+
+            if sum(len(text) for text, _, _ in self.output[held:]) > _HOLD_LIMIT:
+
+                self.pending = None
+
+                held = len(self.output)
+
+        released = self.output[:held]
+
+        self.output = self.output[held:]
+
+        if self.pending is not None:
+            self.pending = (0,) + self.pending[1:]
+
+        return released
+
+    def _supersede(self):
+        """Drops the pending \\arrayrulecolor, restoring the state before it."""
+
+        index, self.rulecolor, tail, self.last_end = self.pending
+
+        _, start, end = self.output[index]
+
+        self.output[index] = ("", start, end)
+
+        for text, _, _ in self.output[index + 1:]:
+            tail = (tail + text[-64:])[-64:]
+
+        self.tail = tail
+
+        self.pending = None
+
+    def keep(self, buffer, node):
+        """Returns the text to write for node: its own text, a shorter one or ""."""
+
+        kind = node.kind
+
+        end = node.start + len(node.text)
+
+        spec = self.spec_follows
+
+        self.spec_follows = False
+
+        if kind == "blank":
+            return _BLANK_LINE
+
+        if kind == "begin":
+
+            self.depth += 1
+
+            self.spec_follows = node.text[len("\\begin{"):-1] in _TABULAR_ENVIRONMENTS
+
+        elif kind == "end":
+
+            self.depth -= 1
+
+            # Settings made inside the closed environment may be local to it.
+            if self.rulecolor is not None and self.rulecolor[1] > self.depth:
+                self.rulecolor = None
+
+            if self.rowcolors is not None and self.rowcolors[1] > self.depth:
+                self.rowcolors = None
+
+            if self.vertical_rules is not None and self.vertical_rules > self.depth:
+                self.vertical_rules = None
+
+            self.last_end = node.text[len("\\end{"):-1]
+
+            return node.text
+
+        elif kind == "hfill":
+
+            # TeX's \par removes the glue ending a paragraph.
+            if self.last_end == "minipage" and _BLANK_LINE_FOLLOWS.match(buffer, end):
+                return ""
+
+        elif kind == "rulecolor":
+            return self._setting(buffer, node, "rulecolor")
+
+        elif kind == "rowcolors":
+
+            match = _NODE_PATTERN.match(node.text)
+
+            # \rowcolors also restarts the row count, so only a single colour
+            # is a no-op when repeated.
+            if match.group("odd") == match.group("even"):
+                return self._setting(buffer, node, "rowcolors")
+
+            self.rowcolors = None
+
+        elif kind == "comment" or node.text.isspace():
+            return node.text
+
+        elif spec is True and _DRAWS_RULE.search(node.text.split("\n", 1)[0]) is not None:
+            self.vertical_rules = self.depth
+
+        self.last_end = None
+
+        return node.text
+
+    def _setting(self, buffer, node, name):
+        """Drops a setting command if it repeats the setting in effect."""
+
+        current = getattr(self, name)
+
+        if current is not None and current[0] == node.text and current[1] <= self.depth:
+            if self._droppable(buffer, node) is True:
+                return ""
+
+        setattr(self, name, (node.text, self.depth))
+
+        self.last_end = None
+
+        return node.text
+
+    def _droppable(self, buffer, node):
+        """Returns True if removing node leaves the tokens around it unchanged."""
+
+        end = node.start + len(node.text)
+
+        if _REST_OF_LINE_BLANK.match(buffer, end) is not None:
+
+            # Alone on its line, the line is left empty: a paragraph break,
+            # which is only a no-op in vertical mode.
+            return (
+                _LINE_START.search(self.tail) is not None
+                and self.last_end in _VERTICAL_ENVIRONMENTS
+            )
+
+        # "\foo\rowcolors{1}{white}{white}bar" must not become "\foobar",
+        # nor "\foo\rowcolors{1}{white}{white} bar" lose its space.
+        return not (
+            _ENDS_WITH_CONTROL_WORD.search(self.tail)
+            and (buffer[end].isalpha() or buffer[end] in " \t")
+        )
+
+
+def optimize_chunks(chunks, deletions=None):
+    """
+    Generator running a peephole pass over tex chunks, such as those of
+    Document.iter_tex, and yielding the optimized tex.
+
+    The tex is parsed into Nodes, and commands that cannot change the output
+    are left out:
+        an \\arrayrulecolor or single-colour \\rowcolors repeating the one in effect
+        an \\arrayrulecolor followed by another before any rule is drawn
+        an \\hfill ending a paragraph after a minipage, which TeX removes anyway
+        runs of blank lines, which make a single paragraph break
+
+    Verbatim environments, \\verb and comments are never changed.
+
+    Args
+    ----
+    chunks: iterable
+        The tex, in chunks of any size.
+    deletions: list
+        If given, the (start, end) character ranges of the input that were
+        left out are appended to it, in order (see remap_spans).
+    """
+
+    peephole = _Peephole()
+
+    buffer = ""
+
+    # Offset of buffer in the input.
+    offset = 0
+
+    # Chunks not yet added to buffer: parsing stops at the last line break,
+    # so chunks without one are only joined to it once another one comes.
+    unparsed = []
+
+    chunks = iter(chunks)
+
+    final = False
+
+    while final is False:
+
+        chunk = next(chunks, None)
+
+        if chunk is None:
+            final = True
+
+        else:
+            unparsed.append(chunk)
+
+            if "\n" not in chunk:
+                continue
+
+        buffer += "".join(unparsed)
+
+        unparsed = []
+
+        scan = iter_nodes(buffer, final)
+
+        written = 0
+
+        while True:
+
+            try:
+                node = next(scan)
+
+            except StopIteration as stop:
+                consumed = stop.value
+
+                break
+
+            peephole.write(buffer, node, offset + node.start)
+
+            written += 1
+
+            # Released as it goes, so a large chunk is streamed through.
+            if written % _RELEASE_SIZE == 0:
+                yield from _released(peephole, False, deletions)
+
+        yield from _released(peephole, final, deletions)
+
+        buffer = buffer[consumed:]
+
+        offset += consumed
+
+
+def _released(peephole, final, deletions):
+    """
+    Generator yielding the tex peephole.release returns, if any, and
+    recording the characters it left out in deletions.
+    """
+
+    pieces = []
+
+    for kept, start, end in peephole.release(final):
+
+        if len(kept) < end - start and deletions is not None:
+            deletions.append((start + len(kept), end))
+
+        if kept != "":
+            pieces.append(kept)
+
+    if len(pieces) > 0:
+        yield "".join(pieces)
+
+
+def remap_spans(spans, deletions):
+    """
+    Moves (start, end, part) character ranges of the input of optimize_chunks
+    onto its output, given the deletions it reported.
+    """
+
+    ends = [end for _, end in deletions]
+
+    removed = [0]
+
+    for start, end in deletions:
+        removed.append(removed[-1] + end - start)
+
+    def remap(offset):
+
+        i = bisect.bisect_right(ends, offset)
+
+        shift = removed[i]
+
+        # Inside a deletion: moved to where the deletion starts.
+        if i < len(deletions) and deletions[i][0] < offset:
+            shift += offset - deletions[i][0]
+
+        return offset - shift
+
+    return [(remap(start), remap(end), part) for start, end, part in spans]
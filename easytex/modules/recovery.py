@@ -0,0 +1,76 @@
+import os
+
+# Ways render_report can retry a compile that ran out of TeX memory.
+STRATEGIES = ["memory", "engine", "rechunk"]
+
+# texmf.cnf settings raised by the "memory" strategy. kpathsea reads them
+# from the environment; main_memory itself only applies when dumping formats.
+RAISED_MEMORY = {
+    "extra_mem_top": "50000000",
+    "extra_mem_bot": "50000000",
+    "pool_size": "10000000",
+    "save_size": "200000",
+    "stack_size": "20000",
+    "buf_size": "2000000",
+}
+
+# Engine used by the "engine" strategy: LuaTeX allocates memory as needed.
+FALLBACK_ENGINE = "lualatex"
+
+# Rows longtable typesets per chunk under the "rechunk" strategy (default 20).
+RECHUNK_SIZE = 5
+
+_DEFAULT_CHUNK_SIZE = 20
+
+
+def check_strategy(strategy):
+    """Raises ValueError unless strategy is None or one of STRATEGIES."""
+
+    if strategy is not None and strategy not in STRATEGIES:
+        names = ", ".join(STRATEGIES)
+
+        raise ValueError(f"recover must be one of {names} or None, got {strategy!r}.")
+
+
+def raised_memory_env(env=None):
+    """
+    Returns a copy of env (default: the current environment)
+    with the RAISED_MEMORY settings.
+    """
+
+    env = dict(os.environ if env is None else env)
+
+    env.update(RAISED_MEMORY)
+
+    return env
+
+
+def rechunk_tex(tex, lines=None):
+    """
+    Returns tex with longtable's chunk size lowered to RECHUNK_SIZE, so fewer
+    rows are held in memory at once.
+
+    Args
+    ----
+    tex: str
+        The complete tex document.
+    lines: tuple
+        The (first, last) lines of the offending table. The chunk size is
+        lowered for those lines only, or for the whole document if None.
+        Commands are added to existing lines, so line numbers do not change.
+    """
+
+    lower = "\\setcounter{LTchunksize}{" + str(RECHUNK_SIZE) + "}"
+
+    if lines is None:
+        return tex.replace("\\begin{document}", "\\begin{document}" + lower, 1)
+
+    first, last = lines
+
+    tex_lines = tex.split("\n")
+
+    tex_lines[first - 1] = lower + tex_lines[first - 1]
+
+    tex_lines[last - 1] += "\\setcounter{LTchunksize}{" + str(_DEFAULT_CHUNK_SIZE) + "}"
+
+    return "\n".join(tex_lines)
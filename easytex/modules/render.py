@@ -0,0 +1,776 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from .aux_seed import reference_state
+from .engines import get_engine
+from .runner import OUTPUT_LIMIT, remaining_time
+from .tex_log import (
+    parse_boxes,
+    parse_errors,
+    parse_memory_usage,
+    parse_page_count,
+    parse_warnings,
+)
+
+# tmpfs mount used for in-memory build directories.
+RAM_BUILD_ROOT = "/dev/shm"
+
+# Free space, in bytes, the tmpfs must have left before a build is put there.
+RAM_MIN_FREE = 256 * 1024 * 1024
+
+# Auxiliary files whose contents feed back into the next pass.
+_AUX_EXTENSIONS = [".aux", ".toc", ".lof", ".lot"]
+
+# The .aux files of \include'd files, listed in the main .aux.
+_INCLUDED_AUX_PATTERN = re.compile(r"^\\@input\{([^}]*)\}", re.MULTILINE)
+
+
+def included_aux_files(jobname, directory="."):
+    """
+    Returns the names of the .aux files written for \\include'd files,
+    as listed in jobname.aux in directory.
+    """
+
+    try:
+        with open(os.path.join(directory, jobname + ".aux"), "r", errors="replace") as file:
+            return _INCLUDED_AUX_PATTERN.findall(file.read())
+
+    except FileNotFoundError:
+        return []
+
+
+def hash_aux_files(jobname, directory="."):
+    """
+    Hashes the auxiliary files produced by a latex pass.
+
+    Args
+    ----
+    jobname: str
+        The tex file name without its extension, e.g. 'output'.
+    directory: str
+        The directory the auxiliary files are written to.
+
+    Returns:
+    digests: dict
+        A dictionary mapping each auxiliary extension to the sha1 hex digest
+        of the file's contents, or None if the file does not exist.
+        The .aux files of \\include'd files are hashed under their names.
+    """
+
+    digests = {}
+
+    for extension in _AUX_EXTENSIONS:
+
+        path = os.path.join(directory, jobname + extension)
+
+        try:
+            with open(path, "rb") as file:
+                digests[extension] = hashlib.sha1(file.read()).hexdigest()
+
+        except FileNotFoundError:
+            digests[extension] = None
+
+    for name in included_aux_files(jobname, directory):
+
+        try:
+            with open(os.path.join(directory, name), "rb") as file:
+                digests[name] = hashlib.sha1(file.read()).hexdigest()
+
+        except FileNotFoundError:
+            digests[name] = None
+
+    return digests
+
+
+# Files kept between renders of the same document by save_aux_files.
+_PERSISTENT_EXTENSIONS = _AUX_EXTENSIONS + [".out"]
+
+
+def restore_aux_files(state_dir, build_dir, jobname):
+    """
+    Copies auxiliary files saved by save_aux_files into a build directory.
+
+    Args
+    ----
+    state_dir: str
+        Directory holding a document's saved auxiliary files.
+    build_dir: str
+        The build directory latex will run in.
+    jobname: str
+        The tex file name without its extension.
+    """
+
+    names = [jobname + extension for extension in _PERSISTENT_EXTENSIONS]
+
+    for name in names + included_aux_files(jobname, state_dir):
+
+        try:
+            shutil.copyfile(os.path.join(state_dir, name), os.path.join(build_dir, name))
+
+        except FileNotFoundError:
+            pass
+
+
+def save_aux_files(build_dir, state_dir, jobname):
+    """
+    Saves the auxiliary files of a finished build for the next render.
+
+    Each file is replaced atomically, so a concurrent render of the same
+    document never restores a partially written file.
+
+    Args
+    ----
+    build_dir: str
+        The build directory latex ran in.
+    state_dir: str
+        Directory holding the document's saved auxiliary files.
+    jobname: str
+        The tex file name without its extension.
+    """
+
+    os.makedirs(state_dir, exist_ok=True)
+
+    names = [jobname + extension for extension in _PERSISTENT_EXTENSIONS]
+
+    for name in names + included_aux_files(jobname, build_dir):
+
+        source = os.path.join(build_dir, name)
+
+        if os.path.exists(source):
+            move_into_place(source, os.path.join(state_dir, name))
+
+
+def read_log(jobname, directory="."):
+    """Returns the contents of a latex .log file, or an empty string if missing."""
+
+    path = os.path.join(directory, jobname + ".log")
+
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as file:
+            return file.read()
+
+    except FileNotFoundError:
+        return ""
+
+
+def make_build_dir(root=None):
+    """
+    Creates a new, uniquely named build directory for a single render.
+
+    Args
+    ----
+    root: str
+        Directory to create the build directory in.
+        If None, the system temporary directory is used.
+
+    Returns:
+    path: str
+        Absolute path of the new build directory.
+    """
+
+    if root is not None:
+        os.makedirs(root, exist_ok=True)
+
+    return os.path.abspath(tempfile.mkdtemp(prefix="easytex-", dir=root))
+
+
+def ram_build_root(fallback=None, min_free=RAM_MIN_FREE):
+    """
+    Returns RAM_BUILD_ROOT if it is a writable directory with at least
+    min_free bytes available, otherwise fallback (a directory on disk).
+
+    Args
+    ----
+    fallback: str
+        The build root to use when the tmpfs is missing or nearly full.
+        None means the system temporary directory.
+    min_free: int
+        Bytes that must be free on the tmpfs.
+    """
+
+    if not os.path.isdir(RAM_BUILD_ROOT) or not os.access(RAM_BUILD_ROOT, os.W_OK):
+        return fallback
+
+    stats = os.statvfs(RAM_BUILD_ROOT)
+
+    if stats.f_bavail * stats.f_frsize < min_free:
+        return fallback
+
+    return RAM_BUILD_ROOT
+
+
+def move_into_place(source, destination):
+    """
+    Atomically moves a rendered file to destination.
+
+    The file is first copied next to destination under a unique temporary name
+    and then renamed over it, so readers never see a partially written pdf.
+
+    Args
+    ----
+    source: str
+        Path of the rendered file.
+    destination: str or file object
+        Final path of the file, or a writable binary stream the file's
+        contents are copied into.
+    """
+
+    if hasattr(destination, "write"):
+
+        with open(source, "rb") as file:
+            shutil.copyfileobj(file, destination)
+
+        return
+
+    directory = os.path.dirname(os.path.abspath(destination))
+
+    handle, temporary = tempfile.mkstemp(
+        prefix="." + os.path.basename(destination) + ".", suffix=".tmp", dir=directory
+    )
+
+    os.close(handle)
+
+    try:
+        shutil.copyfile(source, temporary)
+
+        os.replace(temporary, destination)
+
+    except BaseException:
+
+        try:
+            os.remove(temporary)
+
+        except FileNotFoundError:
+            pass
+
+        raise
+
+
+class CompileResult:
+    """
+    The outcome of compiling a tex file.
+
+    Attributes
+    ----------
+    passes: list
+        A PassResult per engine pass, with wall time, cpu time and max_rss.
+    finalize: PassResult
+        The step producing the pdf from draft output (xdvipdfmx), or None.
+    cached: bool
+        True if the pdf came from a PDFCache and no engine was run.
+    errors: list
+        (message, line) tuples parsed from the final log.
+    warnings: list
+        LaTeX, package and class warnings from the final log.
+    overfull_boxes: int
+        Number of overfull boxes reported in the final log.
+    underfull_boxes: int
+        Number of underfull boxes reported in the final log.
+    memory_usage: dict
+        TeX's "Here is how much of TeX's memory you used" statistics,
+        mapping each statistic to a (used, limit) tuple.
+    pages: int
+        Number of output pages, or None if unknown.
+    log: str
+        The final pass's complete log.
+    source_map: SourceMap
+        Maps log line numbers to the parts that emitted them. Set by
+        Document.render_report, otherwise None.
+    recovery: str
+        The recovery strategy (see recovery.STRATEGIES) that let the compile
+        succeed after "TeX capacity exceeded", or None.
+    """
+
+    def __init__(self, passes=(), log="", cached=False, finalize=None):
+
+        self.passes = list(passes)
+
+        self.finalize = finalize
+
+        self.cached = cached
+
+        self.log = log
+
+        self.errors = parse_errors(log)
+
+        self.warnings = parse_warnings(log)
+
+        self.boxes = parse_boxes(log)
+
+        self.overfull_boxes = sum(1 for kind, _ in self.boxes if kind == "Overfull")
+
+        self.underfull_boxes = sum(1 for kind, _ in self.boxes if kind == "Underfull")
+
+        self.memory_usage = parse_memory_usage(log)
+
+        self.pages = parse_page_count(log)
+
+        self.source_map = None
+
+        self.recovery = None
+
+    def _steps(self):
+
+        if self.finalize is None:
+            return self.passes
+
+        return self.passes + [self.finalize]
+
+    @property
+    def error_parts(self):
+        """(message, line, part) for each error; part is None without a source_map."""
+
+        if self.source_map is None:
+            return [(message, line, None) for message, line in self.errors]
+
+        return self.source_map.annotate(self.errors)
+
+    @property
+    def box_parts(self):
+        """(kind, line, part) for each over/underfull box; part is None without a source_map."""
+
+        if self.source_map is None:
+            return [(kind, line, None) for kind, line in self.boxes]
+
+        return self.source_map.annotate(self.boxes)
+
+    @property
+    def num_passes(self):
+        """The number of engine passes that were run."""
+
+        return len(self.passes)
+
+    @property
+    def wall_time(self):
+        """Total wall seconds spent in engine passes and finalizing."""
+
+        return sum(result.wall_time for result in self._steps())
+
+    @property
+    def cpu_time(self):
+        """Total engine cpu seconds, or None if unavailable."""
+
+        times = [result.cpu_time for result in self._steps()]
+
+        if None in times:
+            return None
+
+        return sum(times)
+
+    def __repr__(self):
+
+        return (
+            f"CompileResult(passes={self.num_passes}, cached={self.cached}, "
+            f"pages={self.pages}, errors={len(self.errors)}, "
+            f"warnings={len(self.warnings)}, overfull_boxes={self.overfull_boxes}, "
+            f"underfull_boxes={self.underfull_boxes}, wall_time={self.wall_time:.3f})"
+        )
+
+
+class _PassTracker:
+    """
+    Decides when a multi-pass compile has converged.
+
+    Shared by compile_tex and compile_tex_async so both follow the same rules.
+    """
+
+    def __init__(
+        self, engine, command, jobname, directory, min_passes, max_passes, timeout,
+        total_timeout, draft_passes=True, seed_state=None,
+    ):
+
+        if isinstance(max_passes, int) is False or max_passes < 1:
+            raise ValueError("max_passes should be an int >= 1.")
+
+        self.engine = engine
+
+        self.command = command
+
+        self.jobname = jobname
+
+        self.directory = directory
+
+        self.min_passes = min_passes
+
+        self.max_passes = max_passes
+
+        self.timeout = timeout
+
+        self.total_timeout = total_timeout
+
+        self.deadline = None
+
+        if total_timeout is not None:
+            self.deadline = time.monotonic() + total_timeout
+
+        self.previous = hash_aux_files(jobname, directory)
+
+        self.cold = all(digest is None for digest in self.previous.values())
+
+        self.seed_state = seed_state
+
+        self.draft_passes = draft_passes
+
+        self.passes = []
+
+        self.drafts = []
+
+        self.finalize = None
+
+    def next_is_draft(self):
+        """
+        Returns True if the next pass can skip writing the pdf.
+
+        Engines that finalize drafts run every pass in draft mode. Other engines
+        only skip the pdf on a first pass without prior auxiliary files, which
+        can never be the last pass: it always creates the .aux.
+        """
+
+        if self.draft_passes is False:
+            return False
+
+        if self.engine.finalizes_drafts is True:
+            return True
+
+        return len(self.passes) == 0 and self.cold is True and self.max_passes > 1
+
+    def needs_finalize(self):
+        """Returns True if the pdf still has to be produced from the last draft."""
+
+        return len(self.drafts) > 0 and self.drafts[-1] is True
+
+    def next_timeout(self):
+        """Returns the timeout for the next pass, raising if none is left."""
+
+        pass_timeout = remaining_time(self.timeout, self.deadline)
+
+        if pass_timeout is not None and pass_timeout <= 0:
+            raise subprocess.TimeoutExpired(self.command, self.total_timeout)
+
+        return pass_timeout
+
+    def _seed_confirmed(self, count):
+        """
+        Returns True if the first pass resolved exactly the numbers and pages
+        the seeded auxiliary files gave it (see aux_seed.write_seed).
+        """
+
+        if count != 1 or self.seed_state is None:
+            return False
+
+        return reference_state(self.directory, self.jobname) == self.seed_state
+
+    def record_pass(self, result, draft=False):
+        """
+        Records a finished pass.
+
+        Args
+        ----
+        result: PassResult
+            The pass returned by run_tex.
+        draft: bool
+            Whether the pass ran in draft mode.
+
+        Returns:
+        done: bool
+            True if no further pass is needed.
+        """
+
+        self.passes.append(result)
+
+        self.drafts.append(draft)
+
+        count = len(self.passes)
+
+        current = hash_aux_files(self.jobname, self.directory)
+
+        self.log = read_log(self.jobname, self.directory)
+
+        rerun = self.engine.needs_rerun(self.log)
+
+        converged = count >= self.min_passes and rerun is False and (
+            current == self.previous or count >= 3 or self._seed_confirmed(count)
+        )
+
+        self.previous = current
+
+        if draft is True and self.engine.finalizes_drafts is False:
+            # This pass wrote no pdf, so it cannot be the last one.
+            return False
+
+        return converged or count >= self.max_passes
+
+    def result(self):
+        """Returns the CompileResult for the recorded passes."""
+
+        return CompileResult(self.passes, self.log, finalize=self.finalize)
+
+
+def compile_tex(
+    tex_file,
+    engine="xelatex",
+    output_directory=None,
+    min_passes=1,
+    max_passes=5,
+    timeout=None,
+    total_timeout=None,
+    cpu_limit=None,
+    memory_limit=None,
+    output_limit=OUTPUT_LIMIT,
+    format_file=None,
+    draft_passes=True,
+    seed_state=None,
+    env=None,
+):
+    """
+    Compiles a tex file, repeating passes only while they are needed.
+
+    After every pass the .aux, .toc, .lof and .lot files are hashed.
+    Compilation stops as soon as a pass leaves them unchanged and the log
+    contains no rerun warnings. Three passes used to be run unconditionally,
+    so passes beyond the third are only run when latex explicitly asks for them.
+
+    Args
+    ----
+    tex_file: str
+        A string representing the tex file to be processed.
+    engine: str or Engine
+        The engine to run: 'xelatex', 'pdflatex', 'lualatex', 'stub'
+        or an engines.Engine instance.
+    output_directory: str
+        Directory latex writes its output files to.
+        If None, the current working directory is used.
+    min_passes: int
+        Minimum number of passes to run.
+    max_passes: int
+        Hard upper limit on the number of passes.
+    timeout: float
+        Seconds a single pass may take before the engine is killed.
+    total_timeout: float
+        Seconds all passes together may take before the engine is killed.
+    cpu_limit: int
+        Optional cpu time limit per pass, in seconds.
+    memory_limit: int
+        Optional address space limit per pass, in bytes.
+    output_limit: int
+        Number of trailing bytes of engine output kept per pass.
+    format_file: str
+        Optional precompiled format (see formats.dump_format) to start from.
+    draft_passes: bool
+        True to run passes that are not the last one without writing a pdf
+        (see engines.Engine).
+    seed_state: tuple
+        The state returned by aux_seed.write_seed if the auxiliary files were
+        seeded. If the first pass confirms it, no second pass is run.
+    env: dict
+        Environment for the engine (see engines.reproducible_env).
+        If None, the current environment is used.
+
+    Returns:
+    result: CompileResult
+        Per-pass timings and the parsed log of the final pass.
+
+    Raises:
+    subprocess.TimeoutExpired
+        If a pass exceeded timeout, or all passes exceeded total_timeout.
+    subprocess.CalledProcessError
+        If the engine reported an error.
+    """
+
+    engine = get_engine(engine)
+
+    command = engine.command(tex_file, output_directory, format_file)
+
+    jobname = os.path.splitext(os.path.basename(tex_file))[0]
+
+    tracker = _PassTracker(
+        engine,
+        command,
+        jobname,
+        output_directory or ".",
+        min_passes,
+        max_passes,
+        timeout,
+        total_timeout,
+        draft_passes,
+        seed_state,
+    )
+
+    done = False
+
+    while done is False:
+
+        draft = tracker.next_is_draft()
+
+        result = engine.run_pass(
+            tex_file,
+            output_directory,
+            format_file,
+            draft,
+            timeout=tracker.next_timeout(),
+            cpu_limit=cpu_limit,
+            memory_limit=memory_limit,
+            output_limit=output_limit,
+            env=env,
+        )
+
+        done = tracker.record_pass(result, draft)
+
+    if tracker.needs_finalize():
+        tracker.finalize = engine.finalize(
+            tex_file,
+            output_directory,
+            timeout=tracker.next_timeout(),
+            cpu_limit=cpu_limit,
+            memory_limit=memory_limit,
+            output_limit=output_limit,
+            env=env,
+        )
+
+    return tracker.result()
+
+
+# Default cap on concurrently running engine processes per event loop.
+MAX_CONCURRENT_ENGINES = os.cpu_count() or 1
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def engine_semaphore():
+    """
+    Returns the running event loop's shared engine semaphore.
+
+    The semaphore is created on first use with MAX_CONCURRENT_ENGINES slots.
+    """
+
+    loop = asyncio.get_running_loop()
+
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_ENGINES)
+
+    return _semaphores[loop]
+
+
+# Threads running the Python side of async renders: validation, export, publishing.
+MAX_EXPORT_THREADS = os.cpu_count() or 1
+
+_export_executor = None
+
+_export_executor_guard = threading.Lock()
+
+
+def export_executor():
+    """
+    Returns the thread pool that runs the blocking, Python side of
+    Document.render_report_async, created on first use with MAX_EXPORT_THREADS
+    threads. It is kept apart from the event loop's default executor, so
+    renders never wait for threads busy with other work, or the reverse.
+    """
+
+    global _export_executor
+
+    with _export_executor_guard:
+
+        if _export_executor is None:
+            _export_executor = ThreadPoolExecutor(
+                MAX_EXPORT_THREADS, thread_name_prefix="easytex-export"
+            )
+
+        return _export_executor
+
+
+async def compile_tex_async(
+    tex_file,
+    engine="xelatex",
+    output_directory=None,
+    min_passes=1,
+    max_passes=5,
+    timeout=None,
+    total_timeout=None,
+    cpu_limit=None,
+    memory_limit=None,
+    output_limit=OUTPUT_LIMIT,
+    format_file=None,
+    draft_passes=True,
+    seed_state=None,
+    env=None,
+    semaphore=None,
+):
+    """
+    Awaitable version of compile_tex.
+
+    Takes the same arguments as compile_tex, plus:
+
+    semaphore: asyncio.Semaphore
+        Caps the number of engine processes running at once.
+        If None, the event loop's shared engine_semaphore() is used.
+    """
+
+    if semaphore is None:
+        semaphore = engine_semaphore()
+
+    engine = get_engine(engine)
+
+    command = engine.command(tex_file, output_directory, format_file)
+
+    jobname = os.path.splitext(os.path.basename(tex_file))[0]
+
+    tracker = _PassTracker(
+        engine,
+        command,
+        jobname,
+        output_directory or ".",
+        min_passes,
+        max_passes,
+        timeout,
+        total_timeout,
+        draft_passes,
+        seed_state,
+    )
+
+    done = False
+
+    while done is False:
+
+        draft = tracker.next_is_draft()
+
+        async with semaphore:
+
+            result = await engine.run_pass_async(
+                tex_file,
+                output_directory,
+                format_file,
+                draft,
+                timeout=tracker.next_timeout(),
+                cpu_limit=cpu_limit,
+                memory_limit=memory_limit,
+                output_limit=output_limit,
+                env=env,
+            )
+
+        done = tracker.record_pass(result, draft)
+
+    if tracker.needs_finalize():
+
+        async with semaphore:
+
+            tracker.finalize = await engine.finalize_async(
+                tex_file,
+                output_directory,
+                timeout=tracker.next_timeout(),
+                cpu_limit=cpu_limit,
+                memory_limit=memory_limit,
+                output_limit=output_limit,
+                env=env,
+            )
+
+    return tracker.result()
@@ -0,0 +1,489 @@
+import asyncio
+import os
+import signal
+import subprocess
+import threading
+import time
+
+# Default number of bytes of engine output kept per pass.
+OUTPUT_LIMIT = 64 * 1024
+
+
+class _OutputTail:
+    """Keeps the last `limit` bytes written to it."""
+
+    def __init__(self, limit=OUTPUT_LIMIT):
+
+        self.limit = limit
+
+        self.data = bytearray()
+
+    def write(self, chunk):
+
+        self.data += chunk
+
+        if len(self.data) > self.limit:
+            del self.data[: len(self.data) - self.limit]
+
+    def text(self):
+
+        return self.data.decode("utf-8", errors="replace")
+
+
+class PassResult:
+    """
+    The outcome of a single engine pass.
+
+    Attributes
+    ----------
+    output: str
+        The last output_limit bytes of the engine's output.
+    wall_time: float
+        Elapsed seconds.
+    user_time: float
+        User cpu seconds of the engine, or None if unavailable.
+    system_time: float
+        System cpu seconds of the engine, or None if unavailable.
+    max_rss: int
+        Peak resident set size of the engine in kilobytes, or None if unavailable.
+    """
+
+    def __init__(self, output, wall_time, usage=None):
+
+        self.output = output
+
+        self.wall_time = wall_time
+
+        self.user_time = None if usage is None else usage.ru_utime
+
+        self.system_time = None if usage is None else usage.ru_stime
+
+        self.max_rss = None if usage is None else usage.ru_maxrss
+
+    @property
+    def cpu_time(self):
+        """User plus system cpu seconds, or None if unavailable."""
+
+        if self.user_time is None:
+            return None
+
+        return self.user_time + self.system_time
+
+    def __repr__(self):
+
+        return (
+            f"PassResult(wall_time={self.wall_time:.3f}, cpu_time={self.cpu_time}, "
+            f"max_rss={self.max_rss})"
+        )
+
+
+def _exit_code(status):
+    """Converts a wait status to a returncode the way subprocess does."""
+
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+
+    return os.WEXITSTATUS(status)
+
+
+def _wait_exit(process):
+    """
+    Blocks until process exits, leaving it unreaped where the platform
+    allows, so its pid cannot be reused by another process meanwhile.
+    """
+
+    if hasattr(os, "waitid") is True:
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+
+    else:
+        process.wait()
+
+
+def _wait(process, timeout=None):
+    """
+    Waits for process, collecting its resource usage where the platform allows.
+
+    Blocks in os.wait4. With a timeout, a timer kills the process group when
+    it expires; the process is only reaped once the timer is stopped.
+
+    Returns:
+    returncode, usage: int, resource.struct_rusage or None
+
+    Raises:
+    subprocess.TimeoutExpired
+        If process was killed after running for timeout seconds.
+    """
+
+    if hasattr(os, "wait4") is False:
+        return process.wait(timeout=timeout), None
+
+    expired = threading.Event()
+
+    timer = None
+
+    if timeout is not None:
+
+        def expire():
+
+            expired.set()
+
+            _kill(process)
+
+        timer = threading.Timer(timeout, expire)
+
+        timer.daemon = True
+
+        timer.start()
+
+    try:
+        if timer is not None:
+
+            _wait_exit(process)
+
+            timer.cancel()
+
+            timer.join()
+
+        _, status, usage = os.wait4(process.pid, 0)
+
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    # Tell Popen the child is reaped so it does not wait on it again.
+    process.returncode = _exit_code(status)
+
+    # A process finishing just as the timer fired is not a timeout.
+    if expired.is_set() is True and process.returncode == -signal.SIGKILL:
+        raise subprocess.TimeoutExpired(process.args, timeout)
+
+    return process.returncode, usage
+
+
+def _drain(stream, tail):
+    """Reads stream until EOF into tail. Run on a background thread."""
+
+    for chunk in iter(lambda: stream.read(4096), b""):
+        tail.write(chunk)
+
+    stream.close()
+
+
+def _reap(process, future):
+    """
+    Sets future to the (returncode, usage) of process, which has exited.
+    Run on the event loop, which also kills the process, so a kill never
+    reaches a pid reused after reaping.
+    """
+
+    try:
+        future.set_result(_wait(process))
+
+    except BaseException as error:
+        future.set_exception(error)
+
+
+def _notify_exit(process, loop, future):
+    """Waits for process to exit, then reaps it on loop. Run on a background thread."""
+
+    _wait_exit(process)
+
+    loop.call_soon_threadsafe(_reap, process, future)
+
+
+def _watch(process, loop):
+    """
+    Returns an asyncio.Future of loop set to the (returncode, usage) of
+    process once it exits.
+
+    Where os.pidfd_open is available the loop watches the process itself.
+    Otherwise a background thread waits for it (see _notify_exit).
+    """
+
+    future = loop.create_future()
+
+    try:
+        pidfd = os.pidfd_open(process.pid)
+
+    except (AttributeError, OSError):
+        pidfd = None
+
+    if pidfd is not None:
+
+        def exited():
+
+            loop.remove_reader(pidfd)
+
+            os.close(pidfd)
+
+            _reap(process, future)
+
+        try:
+            loop.add_reader(pidfd, exited)
+
+            return future
+
+        except NotImplementedError:
+            os.close(pidfd)
+
+    threading.Thread(target=_notify_exit, args=(process, loop, future), daemon=True).start()
+
+    return future
+
+
+def _limit_resources(command, cpu_limit, memory_limit):
+    """
+    Returns command, run through a shell that sets its rlimits first if
+    any limit is given.
+
+    The shell execs the engine, so it keeps the pid and process group.
+    Unlike a preexec_fn, which may deadlock the child when the parent
+    has other threads, it runs no Python code after fork.
+
+    Args
+    ----
+    command: list
+        The engine command line.
+    cpu_limit: int
+        Maximum cpu seconds for the child process (RLIMIT_CPU).
+    memory_limit: int
+        Maximum address space for the child process, in bytes (RLIMIT_AS).
+    """
+
+    limits = []
+
+    if cpu_limit is not None:
+        limits.append("ulimit -t " + str(int(cpu_limit)))
+
+    # ulimit -v takes kilobytes.
+    if memory_limit is not None:
+        limits.append("ulimit -v " + str(int(memory_limit) // 1024))
+
+    if len(limits) == 0:
+        return list(command)
+
+    script = " && ".join(limits + ['exec "$@"'])
+
+    return ["/bin/sh", "-c", script, "sh"] + list(command)
+
+
+def _kill(process):
+    """Kills process together with any children it started."""
+
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+
+    except ProcessLookupError:
+        pass
+
+
+def remaining_time(timeout=None, deadline=None):
+    """
+    Returns the number of seconds a pass may run for, or None for no limit.
+
+    Args
+    ----
+    timeout: float
+        Per-pass timeout in seconds.
+    deadline: float
+        time.monotonic() value by which all passes must have finished.
+    """
+
+    if deadline is None:
+        return timeout
+
+    left = max(deadline - time.monotonic(), 0.0)
+
+    if timeout is None:
+        return left
+
+    return min(timeout, left)
+
+
+def run_tex(
+    command,
+    timeout=None,
+    cpu_limit=None,
+    memory_limit=None,
+    output_limit=OUTPUT_LIMIT,
+    cwd=None,
+    env=None,
+):
+    """
+    Runs a single engine pass non-interactively.
+
+    The engine runs in its own process group with stdin closed. Its combined
+    stdout/stderr is kept in a bounded buffer rather than echoed to the console.
+    TeX engines should also be given NONINTERACTIVE_FLAGS (see engines.Engine).
+
+    Args
+    ----
+    command: list
+        The engine command line.
+    timeout: float
+        Seconds after which the whole process group is killed.
+    cpu_limit: int
+        Optional RLIMIT_CPU for the engine, in seconds.
+    memory_limit: int
+        Optional RLIMIT_AS for the engine, in bytes.
+    output_limit: int
+        Number of trailing bytes of output to keep.
+    cwd: str
+        Working directory for the engine.
+    env: dict
+        Environment for the engine. If None, the current environment is used.
+
+    Returns:
+    result: PassResult
+        The engine's output tail, timings and resource usage.
+
+    Raises:
+    subprocess.TimeoutExpired
+        If the pass did not finish within timeout.
+    subprocess.CalledProcessError
+        If the engine exited with a non-zero status.
+    """
+
+    tail = _OutputTail(output_limit)
+
+    start = time.monotonic()
+
+    process = subprocess.Popen(
+        _limit_resources(command, cpu_limit, memory_limit),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+        cwd=cwd,
+        env=env,
+    )
+
+    reader = threading.Thread(target=_drain, args=(process.stdout, tail), daemon=True)
+
+    reader.start()
+
+    try:
+        returncode, usage = _wait(process, timeout)
+
+    except subprocess.TimeoutExpired:
+
+        _kill(process)
+
+        process.wait()
+
+        reader.join()
+
+        raise subprocess.TimeoutExpired(command, timeout, output=tail.text())
+
+    except BaseException:
+
+        _kill(process)
+
+        process.wait()
+
+        raise
+
+    reader.join()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command, output=tail.text())
+
+    return PassResult(tail.text(), time.monotonic() - start, usage)
+
+
+async def run_tex_async(
+    command,
+    timeout=None,
+    cpu_limit=None,
+    memory_limit=None,
+    output_limit=OUTPUT_LIMIT,
+    cwd=None,
+    env=None,
+):
+    """
+    Awaitable version of run_tex.
+
+    Takes the same arguments, returns a PassResult and raises the same
+    exceptions. If the awaiting task is cancelled the engine is killed.
+
+    The engine's output is read by the event loop, which also reaps the
+    engine with os.wait4 once it exits (see _watch), as run_tex does,
+    rather than through its child watcher, so cpu times and max_rss are
+    collected too.
+    """
+
+    loop = asyncio.get_running_loop()
+
+    tail = _OutputTail(output_limit)
+
+    start = time.monotonic()
+
+    process = subprocess.Popen(
+        _limit_resources(command, cpu_limit, memory_limit),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+        cwd=cwd,
+        env=env,
+    )
+
+    reaped = _watch(process, loop)
+
+    reader = asyncio.StreamReader()
+
+    transport = None
+
+    async def drain():
+
+        nonlocal transport
+
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), process.stdout
+        )
+
+        chunk = await reader.read(4096)
+
+        while chunk:
+            tail.write(chunk)
+
+            chunk = await reader.read(4096)
+
+        # Shielded: after a timeout or cancellation the engine is killed and
+        # reaped is still awaited.
+        return await asyncio.shield(reaped)
+
+    try:
+        returncode, usage = await asyncio.wait_for(drain(), timeout)
+
+    except asyncio.TimeoutError:
+
+        _kill(process)
+
+        await reaped
+
+        raise subprocess.TimeoutExpired(command, timeout, output=tail.text())
+
+    except BaseException:
+
+        _kill(process)
+
+        await reaped
+
+        raise
+
+    finally:
+
+        if transport is not None:
+            transport.close()
+
+        else:
+            process.stdout.close()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command, output=tail.text())
+
+    return PassResult(tail.text(), time.monotonic() - start, usage)
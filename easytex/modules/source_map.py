@@ -0,0 +1,97 @@
+import bisect
+import re
+
+
+class SourceMap:
+    """
+    Maps lines of a generated tex file back to the LatexParts that emitted them.
+
+    Built by Document.merge_parts and export_tex from the character ranges each part's
+    iter_tex() produced. Nested parts have their own, smaller ranges, so a line
+    maps to the innermost part: the Table or Text rather than its Section.
+
+    Line numbers from a compile log can be mapped with annotate(), e.g.
+    document.source_map.annotate(tex_log.parse_errors(error.output))
+    for a subprocess.CalledProcessError raised by render_report.
+    """
+
+    def __init__(self, tex="", spans=(), line_starts=None):
+        """
+        Args
+        ----
+        tex: str
+            The generated tex.
+        spans: list
+            (start, end, part) character ranges of tex, end exclusive.
+        line_starts: list
+            Character offsets at which each line starts, for tex that was
+            streamed rather than kept (see Document.export_tex). Replaces tex.
+        """
+
+        if line_starts is None:
+            line_starts = [0] + [match.end() for match in re.finditer("\n", tex)]
+
+        self._line_starts = line_starts
+
+        self.spans = list(spans)
+
+        # (first line, last line, part) for every span.
+        self.lines = [
+            (self.line_of(start), self.line_of(max(start, end - 1)), part)
+            for start, end, part in self.spans
+        ]
+
+    def line_of(self, offset):
+        """Returns the 1-based line number of a character offset."""
+
+        return bisect.bisect_right(self._line_starts, offset)
+
+    def part_at(self, line):
+        """
+        Returns the innermost part whose tex covers line, or None
+        (e.g. for preamble lines or line None).
+
+        When parts share the line, the one starting last wins: latex reports
+        the line it was reading, so the error is most likely near its end.
+        """
+
+        if line is None:
+            return None
+
+        best = None
+
+        for (first, last, part), (start, end, _) in zip(self.lines, self.spans):
+
+            # Latest start first, then the shortest span (the innermost part).
+            key = (start, start - end)
+
+            if first <= line <= last and (best is None or key > best[0]):
+                best = (key, part)
+
+        return best[1] if best is not None else None
+
+    def lines_of(self, part):
+        """Returns the (first, last) lines emitted by part, or None."""
+
+        for first, last, candidate in self.lines:
+            if candidate is part:
+                return first, last
+
+        return None
+
+    def annotate(self, items):
+        """
+        Adds the responsible part to (value, line) tuples,
+        such as those of tex_log.parse_errors or tex_log.parse_boxes.
+
+        Returns:
+        items: list
+            A list of (value, line, part) tuples. part is None if the line
+            is unknown or not inside any part.
+        """
+
+        return [(value, line, self.part_at(line)) for value, line in items]
+
+    def __repr__(self):
+
+        return f"SourceMap(parts={len(self.lines)}, lines={len(self._line_starts)})"
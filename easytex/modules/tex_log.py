@@ -0,0 +1,144 @@
+import re
+
+_ERROR_PATTERN = re.compile(r"^! (.*)$", re.MULTILINE)
+
+_FILE_LINE_ERROR_PATTERN = re.compile(r"^(?:\./|/)?[^\s:]+\.tex:(\d+): (.*)$", re.MULTILINE)
+
+_ERROR_LINE_PATTERN = re.compile(r"^l\.(\d+)", re.MULTILINE)
+
+_WARNING_PATTERN = re.compile(
+    r"^((?:LaTeX|Package [\w.-]+|Class [\w.-]+)(?: [\w.-]+)? Warning: .*)$", re.MULTILINE
+)
+
+_BOX_PATTERN = re.compile(
+    r"^(Overfull|Underfull) \\([hv])box .*?(?:lines? (\d+)(?:--(\d+))?)?$", re.MULTILINE
+)
+
+_PAGES_PATTERN = re.compile(r"Output written on .*?\((\d+) pages?")
+
+_MEMORY_HEADER = "Here is how much of TeX's memory you used:"
+
+_MEMORY_LINE_PATTERN = re.compile(r"^\s*(\S+) (.+?) out of (\S+)\s*$")
+
+
+def _number(text):
+    """Returns text as an int if it is one, otherwise unchanged."""
+
+    try:
+        return int(text)
+
+    except ValueError:
+        return text
+
+
+def parse_errors(log):
+    """
+    Returns the errors reported in a latex log.
+
+    Returns:
+    errors: list
+        A list of (message, line) tuples. line is the tex source line the
+        error was reported at, or None if the log does not say.
+    """
+
+    errors = []
+
+    for match in _ERROR_PATTERN.finditer(log):
+
+        line = _ERROR_LINE_PATTERN.search(log, match.end())
+
+        # Only trust an l.<n> marker that belongs to this error, not a later one.
+        following = _ERROR_PATTERN.search(log, match.end())
+
+        if line is not None and (following is None or line.start() < following.start()):
+            errors.append((match.group(1), int(line.group(1))))
+
+        else:
+            errors.append((match.group(1), None))
+
+    for match in _FILE_LINE_ERROR_PATTERN.finditer(log):
+        errors.append((match.group(2), int(match.group(1))))
+
+    return errors
+
+
+def parse_capacity_exceeded(log):
+    """
+    Returns the (message, line) of a "TeX capacity exceeded" error in a latex
+    log or engine output, or None if there is none.
+    """
+
+    for message, line in parse_errors(log):
+        if message.startswith("TeX capacity exceeded"):
+            return message, line
+
+    return None
+
+
+def parse_warnings(log):
+    """Returns the LaTeX, package and class warnings in a latex log."""
+
+    return _WARNING_PATTERN.findall(log)
+
+
+def parse_boxes(log):
+    """
+    Returns the overfull and underfull boxes reported in a latex log.
+
+    Returns:
+    boxes: list
+        A list of (kind, line) tuples, where kind is 'Overfull' or 'Underfull'
+        and line is the first tex source line of the box, or None.
+    """
+
+    boxes = []
+
+    for match in _BOX_PATTERN.finditer(log):
+
+        line = match.group(3)
+
+        boxes.append((match.group(1), int(line) if line is not None else None))
+
+    return boxes
+
+
+def parse_memory_usage(log):
+    """
+    Parses the "Here is how much of TeX's memory you used" statistics.
+
+    Returns:
+    usage: dict
+        Maps each statistic (e.g. 'words of memory') to a (used, limit) tuple.
+    """
+
+    usage = {}
+
+    start = log.rfind(_MEMORY_HEADER)
+
+    if start == -1:
+        return usage
+
+    for line in log[start + len(_MEMORY_HEADER):].split("\n")[1:]:
+
+        match = _MEMORY_LINE_PATTERN.match(line)
+
+        if match is None:
+            break
+
+        usage[match.group(2)] = (_number(match.group(1)), _number(match.group(3)))
+
+    return usage
+
+
+def parse_page_count(log):
+    """Returns the number of pages latex reports writing, or None if it did not say."""
+
+    match = _PAGES_PATTERN.search(log)
+
+    if match is not None:
+        return int(match.group(1))
+
+    if "No pages of output." in log:
+        return 0
+
+    return None
@@ -1,3 +1,4 @@
+import os
 import re
 
 _latex_special_chars = {
@@ -24,4 +25,46 @@ def clean_tex(tex):
     
     pattern = '|'.join(sorted(re.escape(k) for k in _latex_special_chars))
     
-    return re.sub(pattern, lambda m: _latex_special_chars.get(m.group(0)), tex)
\ No newline at end of file
+    return re.sub(pattern, lambda m: _latex_special_chars.get(m.group(0)), tex)
+
+# Extensions tried by graphicx when an image is referenced without one.
+_graphic_extensions = ["", ".pdf", ".png", ".jpg", ".jpeg", ".eps"]
+
+def resolve_file(filename, search_paths=("", "images/"), extensions=("",)):
+    """
+    Returns the path latex would load for filename, or None if it cannot be found.
+    
+    Args
+    ----
+    filename: str
+        A file name as written in the tex source.
+    search_paths: list
+        Directory prefixes to try, in order.
+    extensions: list
+        Extensions to try, in order.
+    """
+    
+    for prefix in search_paths:
+        for extension in extensions:
+            
+            path = os.path.join(prefix, filename + extension)
+            
+            if os.path.isfile(path):
+                return path
+            
+    return None
+
+def resolve_graphic(filename, graphics_path=None):
+    """
+    Returns the image file an \\adjustimage{filename} resolves to, or None.
+    
+    Mirrors the lookup latex performs: the working directory, the figure's
+    graphics_path and the preamble's \\graphicspath{ {images/} }.
+    """
+    
+    search_paths = ["", "images/"]
+    
+    if graphics_path is not None:
+        search_paths.insert(1, graphics_path)
+        
+    return resolve_file(filename, search_paths, _graphic_extensions)
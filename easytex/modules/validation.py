@@ -0,0 +1,226 @@
+import re
+
+from .utils import resolve_file, resolve_graphic
+
+_ENVIRONMENT_PATTERN = re.compile(r"\\(begin|end)\{([^}]*)\}")
+
+_VERBATIM_PATTERN = re.compile(r"\\begin\{verbatim\}.*?\\end\{verbatim\}", re.DOTALL)
+
+_HYPERTARGET_PATTERN = re.compile(r"\\hypertarget\{([^}]*)\}")
+
+
+def _walk(document):
+    """
+    Yields (part, containers) for every LatexPart in the document, where
+    containers is a tuple of the Containers enclosing the part, outermost first.
+    """
+
+    # Imported here to avoid a circular import: the classes import modules.
+    from ..classes.Columns import Columns
+    from ..classes.PDFs import PDFs
+    from ..classes.base_classes.Container import Container
+    from ..classes.base_classes.LatexPart import LatexPart
+    from ..classes.base_classes.Lazy import Lazy
+
+    stack = [(part, ()) for part in reversed(document.parts)]
+
+    while stack:
+
+        part, containers = stack.pop()
+
+        if part is None:
+            continue
+
+        if isinstance(part, Lazy):
+            part = part.build()
+
+        yield part, containers
+
+        if isinstance(part, (Columns, PDFs)):
+            children = [child for child in part.data if isinstance(child, LatexPart)]
+
+        elif isinstance(part, Container):
+            children = part.children
+
+        else:
+            children = []
+
+        inner = containers + (part,)
+
+        stack.extend((child, inner) for child in reversed(children))
+
+
+def _describe(part):
+    """Returns a short description of a part for problem reports."""
+
+    if hasattr(part, "label"):
+        return f"{type(part).__name__} {part.label!r}"
+
+    if hasattr(part, "name"):
+        return f"{type(part).__name__} {part.name!r}"
+
+    return type(part).__name__
+
+
+def _environment_problem(tex):
+    """
+    Returns a description of the first unbalanced \\begin or \\end in tex,
+    or None if every environment is closed in order.
+    """
+
+    stack = []
+
+    for match in _ENVIRONMENT_PATTERN.finditer(_VERBATIM_PATTERN.sub("", tex)):
+
+        command, name = match.groups()
+
+        if command == "begin":
+            stack.append(name)
+
+        elif len(stack) == 0:
+            return f"\\end{{{name}}} has no matching \\begin"
+
+        elif stack[-1] != name:
+            return f"\\begin{{{stack[-1]}}} is closed by \\end{{{name}}}"
+
+        else:
+            stack.pop()
+
+    if len(stack) > 0:
+        return f"\\begin{{{stack[-1]}}} is never closed"
+
+    return None
+
+
+class ProblemFinder:
+    """
+    Collects the problems find_problems reports, one part at a time, so they
+    can be gathered by a walk of the document made for other reasons too
+    (see Document._survey). Only names are kept, not the parts.
+    """
+
+    def __init__(self, document):
+        """
+        Args
+        ----
+        document: Document
+            The document the parts belong to.
+        """
+
+        # Imported here to avoid a circular import: the classes import modules.
+        from ..classes.Environment import Environment
+        from ..classes.Figure import Figure
+        from ..classes.PDFs import PDFs
+        from ..classes.Table import Table
+
+        self._classes = Environment, Figure, PDFs, Table
+
+        self._problems = []
+
+        # Label -> type names of the parts using it.
+        self._labels = {}
+
+        self._anchors = set(
+            name
+            for name, enabled in [("toc", document.toc), ("lof", document.lof), ("lot", document.lot)]
+            if enabled is True
+        )
+
+        # (description, link_target) of every part with a link_target.
+        self._targets = []
+
+    def check(self, part, containers=()):
+        """
+        Checks one part.
+
+        Args
+        ----
+        part: LatexPart
+            The part, as reached in document order.
+        containers: tuple
+            The Containers enclosing part, outermost first.
+        """
+
+        Environment, Figure, PDFs, Table = self._classes
+
+        problems = self._problems
+
+        self._anchors.update(_HYPERTARGET_PATTERN.findall(part.tex or ""))
+
+        if getattr(part, "link_target", None) is not None:
+            self._targets.append((_describe(part), part.link_target))
+
+        if isinstance(part, Figure) or (
+            isinstance(part, Table) and "\\label{" + part.label + "}" in part.tex
+        ):
+            self._labels.setdefault(part.label, []).append(type(part).__name__)
+
+        # Closed in reverse order, as by Container.layout.
+        problem = _environment_problem((part.tex or "") + "".join(reversed(part.close_command)))
+
+        if problem is not None:
+            problems.append(f"{_describe(part)}: {problem}.")
+
+        if isinstance(part, Figure) and part.filename != "":
+            if resolve_graphic(part.filename, part.graphics_path) is None:
+                problems.append(f"{_describe(part)}: image {part.filename!r} not found.")
+
+        if isinstance(part, PDFs):
+            for name in part.data:
+                if name is None:
+                    problems.append("PDFs: a page has no file name.")
+
+                elif resolve_file(str(name), extensions=["", ".pdf"]) is None:
+                    problems.append(f"PDFs: file {name!r} not found.")
+
+        if isinstance(part, Table) and part.table_type == "longtable":
+
+            in_adjustbox = any(
+                isinstance(container, Environment) and "Adjustbox" in container.type
+                for container in containers
+            )
+
+            if in_adjustbox is True:
+                problems.append(f"{_describe(part)}: a longtable cannot be inside an adjustbox.")
+
+    def problems(self):
+        """Returns every problem found so far, in document order."""
+
+        problems = list(self._problems)
+
+        for label, names in self._labels.items():
+            if len(names) > 1:
+                described = ", ".join(names)
+
+                problems.append(f"Label {label!r} is used by {len(names)} parts ({described}).")
+
+        for described, target in self._targets:
+            if target not in self._anchors:
+                problems.append(f"{described}: link_target {target!r} has no matching anchor.")
+
+        return problems
+
+
+def find_problems(document):
+    """
+    Checks a document's part tree for mistakes that would otherwise only show
+    up after one or more latex passes.
+
+    Checks for:
+        duplicate Table and Figure labels
+        link_targets without a matching anchor
+        unbalanced \\begin/\\end in a part's tex and close_command
+        missing Figure images and PDFs files
+        longtables inside an adjustbox Environment
+
+    Returns:
+    problems: list
+        A description of every problem found, in document order.
+    """
+
+    finder = ProblemFinder(document)
+
+    for part, containers in _walk(document):
+        finder.check(part, containers)
+
+    return finder.problems()
@@ -0,0 +1,98 @@
+import copy
+import pickle
+
+import easytex as e
+
+
+def make_document():
+
+    document = e.Document(e.Preamble(title="Title"))
+
+    shared = e.Text("shared")
+
+    section = e.Section("A")
+
+    section.add(shared)
+
+    environment = e.Environment(e.Text("boxed"))
+
+    environment.add_adjustbox()
+
+    section.add(environment)
+
+    subsection = e.Section("A1", level=2)
+
+    subsection.add(shared)
+
+    section.add(subsection)
+
+    document.add(section)
+
+    document.add(e.Columns([e.Text("left"), e.Text("right")]))
+
+    document.add(e.PDFs(["a.pdf", "b.pdf"], rotation=[0, 0]))
+
+    return document
+
+
+def render(document):
+
+    return "".join(document.iter_tex())
+
+
+def check_round_trip(restore):
+
+    document = make_document()
+
+    # Fills the render caches, which must not go stale in the copy.
+    original = render(document)
+
+    restored = restore(document)
+
+    assert render(restored) == original
+
+    section, columns, pdfs = restored.parts
+
+    # The Text is in both sections, and both see the edit.
+    section.children[0].add(" edited")
+
+    assert render(restored).count("shared edited") == 2
+
+    columns[0] = e.Text("new column")
+
+    pdfs.rotation[1] = 90
+
+    section.children[1].set_close_command("%closed")
+
+    tex = render(restored)
+
+    assert "new column" in tex and "angle=90" in tex and "%closed" in tex
+
+    assert render(document) == original
+
+
+def test_pickle_round_trip():
+
+    check_round_trip(lambda document: pickle.loads(pickle.dumps(document)))
+
+
+def test_deepcopy_round_trip():
+
+    check_round_trip(copy.deepcopy)
+
+
+def test_shallow_copy_keeps_original():
+
+    document = make_document()
+
+    section = document.parts[0]
+
+    original = render(document)
+
+    copied = copy.copy(section)
+
+    copied.add(e.Text("only in the copy"))
+
+    assert render(document) == original
+
+    assert "only in the copy" in copied.unpack(copied)